@@ -3,21 +3,649 @@
 # Purpose: Detect weld groups, classify Lap vs T joints, build Side A/B/C sets,
 #          and assign elements to global output sets (M*) with fixed SIDs.
 
-import ansa
-from ansa import base, constants
+try:
+    import ansa
+    from ansa import base, constants
+except ImportError:
+    # Headless: weld_backend.install_backend() sets a SnapshotDeck as base.
+    ansa = base = constants = None
+
+import contextlib
+import hashlib
+import itertools
+import json
 import math
-from collections import defaultdict, deque
+import multiprocessing
+import os
+import sys
+import time
+from types import SimpleNamespace
+from array import array
+from collections import defaultdict
+from multiprocessing import shared_memory
 
+import numpy as np
 
-def find_sets_by_name(deck):
-    name_to_set = {}
-    all_sets = base.CollectEntities(deck, None, "SET") or []
-    for s in all_sets:
-        vals = base.GetEntityCardValues(deck, s, ("Name",))
-        name = vals.get("Name")
+
+GRID_KEYS = ("G1", "G2", "G3", "G4", "G5", "G6", "G7", "G8")
+
+# Everything derived from the deck once per run (connectivity snapshot,
+# coordinates, set registry, ...) lives here so every stage shares it.
+_RUN_CACHE = {}
+# Hits and misses per cache kind (first element of the key), for RunReport.
+_CACHE_STATS = defaultdict(lambda: [0, 0])
+
+
+def run_cache(key, build):
+    stats = _CACHE_STATS[key[0]]
+    if key in _RUN_CACHE:
+        stats[0] += 1
+    else:
+        stats[1] += 1
+        _RUN_CACHE[key] = build()
+    return _RUN_CACHE[key]
+
+
+def reset_run_cache():
+    _RUN_CACHE.clear()
+
+
+def dense_lookup(sorted_ids, ids):
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(sorted_ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    pos = np.searchsorted(sorted_ids, ids)
+    pos[pos >= len(sorted_ids)] = 0
+    return np.where(sorted_ids[pos] == ids, pos, -1)
+
+
+class ShellSnapshot:
+    # CSR connectivity of every shell in the deck, sorted by element ID.
+    # Element i owns nodes[offsets[i]:offsets[i + 1]], which are dense
+    # indices into grid_ids (sorted unique GRID IDs).
+
+    def __init__(self, elem_ids, offsets, grid_ids, nodes, elems=None):
+        self.elem_ids = elem_ids
+        self.offsets = offsets
+        self.grid_ids = grid_ids
+        self.nodes = nodes
+        self.elems = elems
+
+    def __len__(self):
+        return len(self.elem_ids)
+
+    def index(self, elems):
+        ids = np.fromiter(
+            (e if isinstance(e, (int, np.integer)) else e._id for e in elems),
+            dtype=np.int64,
+            count=len(elems)
+        )
+        return self.index_ids(ids)
+
+    def index_ids(self, ids):
+        return dense_lookup(self.elem_ids, ids)
+
+    def grid_index(self, gids):
+        return dense_lookup(self.grid_ids, gids)
+
+    def node_slice(self, i):
+        return self.nodes[self.offsets[i]:self.offsets[i + 1]]
+
+    def node_ids(self, i):
+        return self.grid_ids[self.node_slice(i)].tolist()
+
+    def grids(self, elem):
+        eid = elem if isinstance(elem, (int, np.integer)) else elem._id
+        i = int(np.searchsorted(self.elem_ids, eid))
+        if i >= len(self.elem_ids) or self.elem_ids[i] != eid:
+            raise KeyError(f"SHELL {eid} is not in the connectivity snapshot.")
+        return self.node_ids(i)
+
+    def handles(self, idx):
+        return [self.elems[i] for i in idx]
+
+
+def build_shell_snapshot(deck, shells=None):
+    if shells is None:
+        shells = base.CollectEntities(deck, None, "SHELL") or []
+
+    ids = array("q")
+    counts = array("q")
+    flat = array("q")
+
+    for e in shells:
+        vals = base.GetEntityCardValues(deck, e, GRID_KEYS)
+        row = [vals[k] for k in GRID_KEYS if vals.get(k)]
+        ids.append(e._id)
+        counts.append(len(row))
+        flat.extend(row)
+
+    return snapshot_from_rows(
+        np.frombuffer(ids, dtype=np.int64),
+        np.frombuffer(counts, dtype=np.int64),
+        np.frombuffer(flat, dtype=np.int64),
+        list(shells)
+    )
+
+
+def snapshot_from_rows(ids, counts, flat, elems=None):
+    order = np.argsort(ids, kind="stable")
+    src_offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=src_offsets[1:])
+
+    counts = counts[order]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    gather = (
+        np.repeat(src_offsets[:-1][order] - offsets[:-1], counts)
+        + np.arange(offsets[-1], dtype=np.int64)
+    )
+    grid_ids, nodes = np.unique(flat[gather], return_inverse=True)
+
+    if elems is not None:
+        elems = [elems[i] for i in order]
+
+    return ShellSnapshot(
+        ids[order].copy(),
+        offsets,
+        grid_ids,
+        nodes.astype(np.int32).ravel(),
+        elems
+    )
+
+
+def shell_snapshot(deck):
+    return run_cache(("snapshot", deck), lambda: build_shell_snapshot(deck))
+
+
+def shell_incidence(snap, elem_idx, node_map=None):
+    # (position in elem_idx, dense node) for every element-node slot. With a
+    # node_map (weld_node_map) coincident nodes come back as one node.
+    elem_idx = np.asarray(elem_idx, dtype=np.int64)
+    starts = snap.offsets[elem_idx]
+    counts = snap.offsets[elem_idx + 1] - starts
+    slots = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    nodes = snap.nodes[slots]
+    if node_map is not None:
+        nodes = node_map[nodes]
+    return np.repeat(np.arange(len(elem_idx)), counts), nodes
+
+
+def union_find_roots(n, u, v):
+    # Array union-find: hook the larger root under the smaller one for every
+    # unsatisfied pair, then compress by pointer jumping. Every root ends up
+    # as the smallest index in its component.
+    parent = np.arange(n, dtype=np.int64)
+    u = np.asarray(u, dtype=np.int64)
+    v = np.asarray(v, dtype=np.int64)
+
+    while len(u):
+        pu = parent[u]
+        pv = parent[v]
+        diff = pu != pv
+        if not diff.any():
+            break
+        u, v, pu, pv = u[diff], v[diff], pu[diff], pv[diff]
+        np.minimum.at(parent, np.maximum(pu, pv), np.minimum(pu, pv))
+
+        while True:
+            up = parent[parent]
+            if np.array_equal(up, parent):
+                break
+            parent = up
+
+    return parent
+
+
+def incidence_components(n_elems, local, nodes):
+    order = np.argsort(nodes, kind="stable")
+    sorted_nodes = nodes[order]
+    owners = local[order]
+    head = np.ones(len(order), dtype=bool)
+    head[1:] = sorted_nodes[1:] != sorted_nodes[:-1]
+    first_owner = owners[head][np.cumsum(head) - 1]
+
+    roots = union_find_roots(n_elems, owners, first_owner)
+    _, labels = np.unique(roots, return_inverse=True)
+    return labels.ravel(), int(labels.max()) + 1 if len(labels) else 0
+
+
+def label_components(snap, elem_idx, node_map=None):
+    # Component label per element of elem_idx, numbered in order of first
+    # appearance. Elements are joined when they share a node.
+    local, nodes = shell_incidence(snap, elem_idx, node_map)
+    return incidence_components(len(elem_idx), local, nodes)
+
+
+def component_members(labels, n_comps):
+    # Members of component c are order[offsets[c]:offsets[c + 1]].
+    order = np.argsort(labels, kind="stable")
+    offsets = np.zeros(n_comps + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=n_comps), out=offsets[1:])
+    return order, offsets
+
+
+# Cell hash for coincident_pairs; colliding cells only add candidates that
+# the distance test rejects.
+CELL_HASH = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+
+
+def coincident_pairs(xyz, tol):
+    # Row pairs (u < v) of xyz no farther apart than tol. Points are binned
+    # into a uniform grid of cell size tol, so only the 27 cells around a
+    # point can hold a partner. Rows with NaN coordinates never pair up.
+    rows = np.flatnonzero(~np.isnan(xyz).any(axis=1))
+    cells = np.floor(xyz[rows] / tol).astype(np.int64)
+    keys = np.bitwise_xor.reduce(cells * CELL_HASH, axis=1)
+
+    order = np.argsort(keys, kind="stable")
+    cell_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    us, vs = [], []
+    for step in itertools.product((-1, 0, 1), repeat=3):
+        pos = dense_lookup(cell_keys, np.bitwise_xor.reduce((cells + step) * CELL_HASH, axis=1))
+        hit = np.flatnonzero(pos >= 0)
+        n = counts[pos[hit]]
+        u = np.repeat(hit, n)
+        v = order[np.repeat(starts[pos[hit]] - (np.cumsum(n) - n), n) + np.arange(n.sum())]
+
+        keep = u < v
+        u, v = u[keep], v[keep]
+        d = xyz[rows[u]] - xyz[rows[v]]
+        close = np.einsum("ij,ij->i", d, d) <= tol * tol
+        us.append(rows[u[close]])
+        vs.append(rows[v[close]])
+
+    return np.concatenate(us), np.concatenate(vs)
+
+
+class NodeShellIndex:
+    # node -> shells incidence over the snapshot (all shells, or the subset
+    # elem_idx): the snapshot shells using dense node k are
+    # shells[offsets[k]:offsets[k + 1]], and valence[k] is their count.
+
+    def __init__(self, snap, elem_idx=None):
+        self.snap = snap
+        if elem_idx is None:
+            elem_idx = np.arange(len(snap))
+        elem_idx = np.asarray(elem_idx, dtype=np.int64)
+
+        local, nodes = shell_incidence(snap, elem_idx)
+        order = np.argsort(nodes, kind="stable")
+        self.shells = elem_idx[local[order]]
+        self.valence = np.bincount(nodes, minlength=len(snap.grid_ids))
+        self.offsets = np.zeros(len(snap.grid_ids) + 1, dtype=np.int64)
+        np.cumsum(self.valence, out=self.offsets[1:])
+
+    def shells_of(self, node):
+        return self.shells[self.offsets[node]:self.offsets[node + 1]]
+
+    def shells_at(self, nodes):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts = self.offsets[nodes]
+        counts = self.offsets[nodes + 1] - starts
+        slots = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        return np.unique(self.shells[slots])
+
+    def ring(self, elem_idx):
+        # Every shell sharing at least one node with elem_idx (itself included).
+        return self.shells_at(np.unique(shell_incidence(self.snap, elem_idx)[1]))
+
+
+def node_shell_index(deck):
+    return run_cache(("node_shells", deck), lambda: NodeShellIndex(shell_snapshot(deck)))
+
+
+def corner_counts(node_counts):
+    # Corner nodes lead the connectivity: CTRIA3/CTRIA6 have 3, CQUAD4/CQUAD8
+    # (also with some mid-side nodes omitted) have 4.
+    return np.where((node_counts == 3) | (node_counts == 6), 3, 4)
+
+
+class EdgeIndex:
+    # Every corner-to-corner edge of a set of shells, keyed by its sorted
+    # (min, max) dense node pair. Element j (elem_idx[j] in the snapshot)
+    # owns edge slots elem_edge_offsets[j]:elem_edge_offsets[j + 1] in
+    # connectivity order; edge k is used by the local elements
+    # edge_elems[edge_offsets[k]:edge_offsets[k + 1]]. With a node_map
+    # (weld_node_map) edges between coincident nodes are one edge.
+
+    def __init__(self, snap, elem_idx, node_map=None):
+        self.snap = snap
+        self.elem_idx = np.asarray(elem_idx, dtype=np.int64)
+        n = len(self.elem_idx)
+
+        starts = snap.offsets[self.elem_idx]
+        corners = corner_counts(snap.offsets[self.elem_idx + 1] - starts)
+        self.elem_edge_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(corners, out=self.elem_edge_offsets[1:])
+
+        total = int(self.elem_edge_offsets[-1])
+        span = np.repeat(corners, corners)
+        pos = np.arange(total) - np.repeat(self.elem_edge_offsets[:-1], corners)
+        first = np.repeat(starts, corners)
+        a = snap.nodes[first + pos].astype(np.int64)
+        b = snap.nodes[first + (pos + 1) % span].astype(np.int64)
+        if node_map is not None:
+            a, b = node_map[a], node_map[b]
+
+        lo = np.minimum(a, b)
+        hi = np.maximum(a, b)
+        keys, slot_edge = np.unique(lo * len(snap.grid_ids) + hi, return_inverse=True)
+        self.slot_edge = slot_edge.ravel()
+        self.slot_elem = np.repeat(np.arange(n), corners)
+        self.edge_nodes = np.stack(np.divmod(keys, max(len(snap.grid_ids), 1)), axis=1)
+
+        order = np.argsort(self.slot_edge, kind="stable")
+        self.edge_elems = self.slot_elem[order]
+        self.edge_count = np.bincount(self.slot_edge, minlength=len(keys))
+        self.edge_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(self.edge_count, out=self.edge_offsets[1:])
+
+        self._adjacency = None
+
+    def adjacency(self):
+        # (offsets, elems): the local elements sharing an edge with element j
+        # are elems[offsets[j]:offsets[j + 1]], ascending. Built on first use,
+        # a whole-deck index read only for its multi edges never pays for it.
+        if self._adjacency is None:
+            shared = self.edge_count[self.slot_edge] > 1
+            self._adjacency = incidence_adjacency(
+                len(self.elem_idx), self.slot_elem[shared], self.slot_edge[shared]
+            )
+        return self._adjacency
+
+    def __len__(self):
+        return len(self.edge_count)
+
+    def owners(self, k):
+        return self.edge_elems[self.edge_offsets[k]:self.edge_offsets[k + 1]]
+
+    def degree(self):
+        return np.diff(self.adjacency()[0])
+
+    def multi_edges(self, min_shells=3):
+        return np.flatnonzero(self.edge_count >= min_shells)
+
+
+class TripleBounds:
+    # Triple-bound edges of a shell scope (edges used by min_shells or more
+    # scope shells) read off a whole-deck EdgeIndex, with the shells and
+    # nodes on them as dense snapshot indices. node_usage[n] is what walking
+    # the check report gives: per issue, per shell on the edge, +1 on every
+    # node of that shell.
+
+    def __init__(self, edges, scope, min_shells=3):
+        snap = edges.snap
+        in_scope = np.zeros(len(snap), dtype=bool)
+        in_scope[scope] = True
+
+        slot_in = in_scope[edges.elem_idx[edges.slot_elem]]
+        count = np.bincount(edges.slot_edge[slot_in], minlength=len(edges))
+        is_triple = count >= min_shells
+        slots = slot_in & is_triple[edges.slot_edge]
+
+        self.snap = snap
+        self.edge_nodes = edges.edge_nodes[is_triple]
+        self.elem_idx = edges.elem_idx[np.unique(edges.slot_elem[slots])]
+        self.node_idx = np.unique(self.edge_nodes)
+
+        weight = np.bincount(edges.elem_idx[edges.slot_elem[slots]], minlength=len(snap))
+        local, nodes = shell_incidence(snap, self.elem_idx)
+        self.node_usage = np.bincount(
+            nodes, weights=weight[self.elem_idx][local], minlength=len(snap.grid_ids)
+        ).astype(np.int64)
+
+    def __len__(self):
+        return len(self.edge_nodes)
+
+    def elem_ids(self):
+        return self.snap.elem_ids[self.elem_idx]
+
+    def node_ids(self):
+        return self.snap.grid_ids[self.node_idx]
+
+    def handles(self):
+        return self.snap.handles(self.elem_idx)
+
+
+def visible_shell_index(deck):
+    snap = shell_snapshot(deck)
+    idx = snap.index(base.CollectEntities(deck, None, "SHELL", filter_visible=True) or [])
+    return np.unique(idx[idx >= 0])
+
+
+def triple_bounds(deck, scope=None, min_shells=3):
+    # Native stand-in for Checks.mesh.TripleBounds / the triple-joint
+    # violation report, on the visible shells unless a scope is given. The
+    # edge index is built once per run and each scope is answered once.
+    snap = shell_snapshot(deck)
+    edges = run_cache(("edges", deck), lambda: EdgeIndex(snap, np.arange(len(snap))))
+    if scope is None:
+        scope = visible_shell_index(deck)
+    scope = np.asarray(scope, dtype=np.int64)
+    digest = hashlib.blake2b(scope.tobytes(), digest_size=16).digest()
+    return run_cache(
+        ("triple_bounds", deck, min_shells, digest),
+        lambda: TripleBounds(edges, scope, min_shells)
+    )
+
+
+class GridCoordinates:
+    # Contiguous N x 3 positions, row i belongs to grid_ids[i] (the same
+    # dense index the snapshot uses). Rows are NaN until loaded.
+
+    def __init__(self, deck, grid_ids, xyz=None):
+        self.deck = deck
+        self.grid_ids = grid_ids
+        if xyz is None:
+            xyz = np.full((len(grid_ids), 3), np.nan)
+        self.xyz = xyz
+        self.loaded = ~np.isnan(xyz).any(axis=1)
+
+    def index(self, gids):
+        return dense_lookup(self.grid_ids, gids)
+
+    def load(self, dense):
+        dense = np.unique(np.asarray(dense, dtype=np.int64))
+        dense = dense[(dense >= 0) & ~self.loaded[dense]]
+
+        for i in dense.tolist():
+            grid = base.GetEntity(self.deck, "GRID", int(self.grid_ids[i]))
+            self.loaded[i] = True
+            if not grid:
+                continue
+
+            card = base.GetEntityCardValues(self.deck, grid, ("X1", "X2", "X3"))
+            x1 = card.get("X1")
+            x2 = card.get("X2")
+            x3 = card.get("X3")
+
+            if x1 is None or x2 is None or x3 is None:
+                continue
+            self.xyz[i] = (x1, x2, x3)
+
+    def load_shells(self, snap, elem_idx):
+        self.load(shell_incidence(snap, elem_idx)[1])
+
+    def rows(self, dense):
+        dense = np.asarray(dense, dtype=np.int64)
+        self.load(dense)
+        out = self.xyz[dense]
+        out[dense < 0] = np.nan
+        return out
+
+    def coords(self, gids):
+        return self.rows(self.index(gids))
+
+    def coord(self, gid):
+        xyz = self.coords([gid])[0]
+        if np.isnan(xyz).any():
+            return None
+        return tuple(xyz.tolist())
+
+
+def grid_coordinates(deck):
+    return run_cache(
+        ("coords", deck),
+        lambda: GridCoordinates(deck, shell_snapshot(deck).grid_ids)
+    )
+
+
+class SetRegistry:
+    # Name and SID index over every SET in the deck. Built with one scan and
+    # kept in sync with the sets created or deleted through it.
+
+    def __init__(self, deck):
+        self.deck = deck
+        self.cards = {}
+        self.by_name = {}
+        self.by_sid = {}
+
+        for s in base.CollectEntities(deck, None, "SET") or []:
+            card = base.GetEntityCardValues(deck, s, ("Name", "SID")) or {}
+            self._add(s, card.get("Name"), card.get("SID"))
+
+    def _add(self, s, name, sid):
+        self.cards[s] = (name, sid)
         if name:
-            name_to_set[name] = s
-    return name_to_set
+            self.by_name.setdefault(name, []).append(s)
+        if sid is not None:
+            self.by_sid.setdefault(sid, []).append(s)
+
+    def _drop(self, s):
+        name, sid = self.cards.pop(s)
+        for index, key in ((self.by_name, name), (self.by_sid, sid)):
+            bucket = index.get(key)
+            if bucket and s in bucket:
+                bucket.remove(s)
+                if not bucket:
+                    del index[key]
+
+    def get(self, name):
+        bucket = self.by_name.get(name)
+        return bucket[0] if bucket else None
+
+    def with_sids(self, sids):
+        return [s for sid in sids for s in self.by_sid.get(sid, [])]
+
+    def create(self, fields):
+        ent = base.CreateEntity(self.deck, "SET", fields)
+        if ent:
+            sid = fields.get("SID")
+            if sid is None:
+                sid = (base.GetEntityCardValues(self.deck, ent, ("SID",)) or {}).get("SID")
+            self._add(ent, fields.get("Name"), sid)
+        return ent
+
+    def get_or_create(self, name, sid=None):
+        s = self.get(name)
+        if s:
+            return s
+        fields = {"Name": name}
+        if sid is not None:
+            fields["SID"] = sid
+        return self.create(fields)
+
+    def delete(self, sets):
+        doomed = []
+        for s in sets:
+            if s in self.cards and s not in doomed:
+                doomed.append(s)
+
+        if doomed:
+            base.DeleteEntity(doomed)
+            for s in doomed:
+                self._drop(s)
+
+        return len(doomed)
+
+
+def set_registry(deck):
+    return run_cache(("sets", deck), lambda: SetRegistry(deck))
+
+
+def set_membership(deck, sets, filter_visible=True):
+    # Shell membership of any number of SETs as one bitmask per snapshot
+    # shell (bit k: in sets[k]; uint8 up to 8 sets, then wider), plus the
+    # member shells in first-seen order: sets in the given order, each in
+    # the order CollectEntities returns it.
+    snap = shell_snapshot(deck)
+    dtype = np.min_scalar_type((1 << len(sets)) - 1) if sets else np.uint8
+    mask = np.zeros(len(snap), dtype=dtype)
+    parts = [np.zeros(0, dtype=np.int64)]
+
+    for bit, s in enumerate(sets):
+        shells = base.CollectEntities(
+            deck, s, "SHELL", filter_visible=filter_visible, recursive=True
+        ) or []
+        idx = snap.index(shells)
+        idx = idx[idx >= 0]
+        mask[idx] |= dtype.type(1 << bit)
+        parts.append(idx)
+
+    flat = np.concatenate(parts)
+    _, first = np.unique(flat, return_index=True)
+    return flat[np.sort(first)], mask
+
+
+def lowest_bit(mask):
+    return mask & (~mask + 1)
+
+
+class SetWriter:
+    # Set memberships collected while classifying and written with a single
+    # AddToSet per target SET on flush(). add() only appends the handles to
+    # the set's buffer; duplicates are dropped on flush, which writes sets
+    # by name and their members sorted by element ID.
+
+    def __init__(self, deck):
+        self.deck = deck
+        self.pending = {}
+
+    def add(self, set_ent, elems):
+        self.pending.setdefault(set_ent, []).extend(elems)
+
+    def flush(self, patch=False):
+        # patch=True makes every pending set hold exactly its pending members:
+        # shells already in it stay, the rest are removed, only the missing
+        # ones are added.
+        registry = set_registry(self.deck)
+        names = {
+            s: str(registry.cards.get(s, (None, None))[0] or s._id)
+            for s in self.pending
+        }
+        counts = {}
+
+        for s in sorted(self.pending, key=names.get):
+            elems = self.pending.pop(s)
+            ids = np.fromiter((e._id for e in elems), dtype=np.int64, count=len(elems))
+            ids, first = np.unique(ids, return_index=True)
+            add = first
+            if patch:
+                current = base.CollectEntities(self.deck, s, "SHELL") or []
+                have = np.fromiter((e._id for e in current), dtype=np.int64, count=len(current))
+                stale = np.flatnonzero(~np.isin(have, ids)).tolist()
+                if stale:
+                    base.RemoveFromSet(s, [current[k] for k in stale])
+                add = first[~np.isin(ids, have)]
+            if len(add):
+                base.AddToSet(s, [elems[k] for k in add.tolist()])
+            counts[names[s]] = len(ids)
+
+        self.pending = {}
+        return counts
+
+
+def report_set_counts(counts):
+    for name, n in counts.items():
+        print(f"  {name}: {n} elements")
+
+
+def find_sets_by_name(deck):
+    registry = set_registry(deck)
+    return {name: registry.get(name) for name in registry.by_name}
 
 
 def set_is_empty(deck, set_ent):
@@ -26,19 +654,22 @@ def set_is_empty(deck, set_ent):
 
 
 def delete_sets(deck, delete_all_names, delete_if_empty_names):
-    name_to_set = find_sets_by_name(deck)
+    registry = set_registry(deck)
+    doomed = []
 
     for nm in delete_all_names:
-        s = name_to_set.get(nm)
+        s = registry.get(nm)
         if s:
-            base.DeleteEntity(s)
+            doomed.append(s)
 
     for nm in delete_if_empty_names:
-        s = name_to_set.get(nm)
+        s = registry.get(nm)
         if not s:
             continue
         if set_is_empty(deck, s):
-            base.DeleteEntity(s)
+            doomed.append(s)
+
+    registry.delete(doomed)
 
 
 SET_A = "Lap_Joint_delt_Side_A"
@@ -46,6 +677,10 @@ SET_B = "Lap_Joint_delt_Side_B"
 SET_C = "Lap_Joint_delt_Side_C"
 SET_T = "Lap_Joint_delt"
 
+# Weld label bits, in the order the label sets are read.
+LABELS = ("A", "B", "C", "T")
+LABEL_BITS = {lbl: 1 << k for k, lbl in enumerate(LABELS)}
+
 
 OUT_SETS = {
     "M450": 450,
@@ -61,24 +696,16 @@ EPS = 1e-9
 
 
 def get_set_by_name(deck, name):
-    for s in base.CollectEntities(deck, None, "SET"):
-        card = base.GetEntityCardValues(deck, s, ("Name", "SID"))
-        if card and card.get("Name") == name:
-            return s
-    return None
+    return set_registry(deck).get(name)
 
 
 def ensure_clean_global_sets(deck, out_defs):
-    # ###########################
-    ids = set(out_def.values())
-    for s in base.CollectEntities(deck, None, "SET"):
-        card = base.GetEntityCardValues(deck, s, ("SID",))
-        if card and card.get("SID") in ids:
-            base.DeleteEntity(s)
+    registry = set_registry(deck)
+    registry.delete(registry.with_sids(out_defs.values()))
 
     created = {}
-    for name, sid in out_def.items():
-        ent = base.CreateEntity(deck, "SET", {"Name": name, "SID": sid})
+    for name, sid in out_defs.items():
+        ent = registry.create({"Name": name, "SID": sid})
         if not ent:
             raise RuntimeError(f"Failed to create SET '{name}' with ID {sid}.")
         created[name] = ent
@@ -96,57 +723,84 @@ def collect_visible_shells(deck, container_entity):
     )
 
 
-def get_elem_grids(deck, elem):
-    keys = ("G1", "G2", "G3", "G4", "G5", "G6", "G7", "G8")
-    vals = base.GetEntityCardValues(deck, elem, keys)
-    grids = [vals[k] for k in keys if k in vals and vals[k]]
-    return [gid for gid in grids if gid and gid != 0]
-
-
-def get_grid_coords(deck, grid_id):
-    grid = base.GetEntity(deck, "GRID", grid_id)
-    if not grid:
-        return None
-
-    card = base.GetEntityCardValues(deck, grid, ("X1", "X2", "X3"))
-    x1 = card.get("X1")
-    x2 = card.get("X2")
-    x3 = card.get("X3")
-
-    if x1 is None or x2 is None or x3 is None:
-        return None
+# Vector kernels over (..., 3) arrays. Undefined results (missing
+# coordinates, zero-length vectors) come out as NaN rows.
 
-    return (x1, x2, x3)
+def v_sub(a, b):
+    return np.subtract(a, b, dtype=np.float64)
 
 
-def v_sub(a, b):
-    if a is None or b is None:
-        return None
-    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+def v_dot(a, b):
+    return np.einsum("...k,...k->...", a, b)
 
 
 def v_len(a):
-    if a is None:
-        return 0.0
-    return math.sqrt(a[0]*a[0] + a[1]*a[1] + a[2]*a[2])
+    return np.sqrt(v_dot(a, a))
 
 
 def v_norm(a):
-    L = v_len(a)
-    if L <= EPS:
-        return None
-    return (a[0]/L, a[1]/L, a[2]/L)
+    L = v_len(a)[..., None]
+    ok = L > EPS
+    return np.where(ok, a / np.where(ok, L, 1.0), np.nan)
+
+
+class ShellGeometry:
+    # Unit normal per snapshot shell, computed on first use. Only the shells
+    # asked for get a row: row[i] is the normal row of snapshot shell i, -1
+    # until loaded, so a weld-sized lookup does not pay for the whole deck.
+
+    def __init__(self, snap, coords):
+        self.snap = snap
+        self.coords = coords
+        self.row = np.full(len(snap), -1, dtype=np.int32)
+        self.normal = np.empty((0, 3))
+        self.count = 0
+
+    def load(self, elem_idx):
+        elem_idx = np.unique(np.asarray(elem_idx, dtype=np.int64))
+        elem_idx = elem_idx[(elem_idx >= 0) & (self.row[elem_idx] < 0)]
+        if not len(elem_idx):
+            return
+
+        starts = self.snap.offsets[elem_idx]
+        tri = corner_counts(self.snap.offsets[elem_idx + 1] - starts) == 3
+        k = np.arange(4)
+        # Triangles repeat corner 0 in slot 3, so the quad diagonal formula
+        # (P3 - P1) x (P4 - P2) reduces to (P2 - P1) x (P3 - P1) for them.
+        slots = starts[:, None] + np.where(tri[:, None] & (k == 3), 0, k)
+        p = self.coords.rows(self.snap.nodes[slots])
+
+        end = self.count + len(elem_idx)
+        if end > len(self.normal):
+            grown = np.empty((max(end, 2 * len(self.normal)), 3))
+            grown[:self.count] = self.normal[:self.count]
+            self.normal = grown
+        self.normal[self.count:end] = v_norm(np.cross(p[:, 2] - p[:, 0], p[:, 3] - p[:, 1]))
+        self.row[elem_idx] = np.arange(self.count, end)
+        self.count = end
+
+    def normals(self, elem_idx):
+        elem_idx = np.asarray(elem_idx, dtype=np.int64)
+        self.load(elem_idx)
+        out = np.full((len(elem_idx), 3), np.nan)
+        ok = elem_idx >= 0
+        out[ok] = self.normal[self.row[elem_idx[ok]]]
+        return out
+
+
+def shell_geometry(deck):
+    return run_cache(
+        ("geometry", deck),
+        lambda: ShellGeometry(shell_snapshot(deck), grid_coordinates(deck))
+    )
 
 
-def v_dot(a, b):
-    if a is None or b is None:
-        return None
-    return a[0]*b[0] + a[1]*b[1] + a[2]*b[2]
+def get_elem_grids(deck, elem):
+    return shell_snapshot(deck).grids(elem)
 
 
-def normal_of_shell(elem):
-    n = base.GetNormalVectorOfShell(elem)
-    return v_norm(n) if n is not None else None
+def get_grid_coords(deck, grid_id):
+    return grid_coordinates(deck).coord(grid_id)
 
 
 def build_union_and_labels(deck):
@@ -161,224 +815,244 @@ def build_union_and_labels(deck):
         if not s:
             raise ValueError(f"SET for label '{lbl}' not found.")
 
-    shells_by_label = {
-        lbl: collect_visible_shells(deck, s)
-        for lbl, s in sets.items()
-    }
+    # One label per shell: the first of A, B, C, T whose set holds it.
+    union, mask = set_membership(deck, [sets[lbl] for lbl in LABELS])
+    return shell_snapshot(deck).handles(union), lowest_bit(mask[union])
 
-    union_shells = []
-    labels_map = {}
-    seen = set()
 
-    for lbl in ("A", "B", "C", "T"):
-        for e in shells_by_label[lbl]:
-            if e not in seen:
-                seen.add(e)
-                union_shells.append(e)
-                labels_map.setdefault(e, set()).add(lbl)
+class WeldArrays:
+    # The array side of WeldIncidence plus, once attached, the local node
+    # coordinates and shell normals: everything the component classifiers
+    # read. Plain arrays only, so it can be rebuilt from shared memory.
 
-    return union_shells, labels_map
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.elem_offsets = arrays["elem_offsets"]
+        self.elem_nodes = arrays["elem_nodes"]
+        self.node_offsets = arrays["node_offsets"]
+        self.node_owners = arrays["node_owners"]
+        self.comp_order = arrays["comp_order"]
+        self.comp_offsets = arrays["comp_offsets"]
+        self.label_bits = arrays["label_bits"]
+        self.xyz = arrays.get("xyz")
+        self.normals = arrays.get("normals")
 
+    def owners(self, node):
+        return self.node_owners[self.node_offsets[node]:self.node_offsets[node + 1]]
 
-def build_grid_to_elems(deck, elems):
-    elem_grids = {}
-    grid_to_elems = defaultdict(list)
+    def nodes_of(self, j):
+        return self.elem_nodes[self.elem_offsets[j]:self.elem_offsets[j + 1]]
 
-    for e in elems:
-        grids = get_elem_grids(deck, e)
-        elem_grids[e] = grids
-        for gid in grids:
-            grid_to_elems[gid].append(e)
+    def members(self, c):
+        return self.comp_order[self.comp_offsets[c]:self.comp_offsets[c + 1]]
 
-    return grid_to_elems, elem_grids
+    def has(self, j, lbl):
+        return (self.label_bits[j] & LABEL_BITS[lbl]) != 0
 
+    def members_with(self, c, lbl):
+        members = self.members(c)
+        return members[self.has(members, lbl)]
 
-def build_adjacency_any_grid(elems, elem_grids):
-    grid_to_elems = defaultdict(list)
 
-    for e, grids in elem_grids.items():
-        for g in grids:
-            grid_to_elems[g].append(e)
+class WeldIncidence(WeldArrays):
+    # Element-node incidence of the weld shells in both directions, in local
+    # indices (element j is elems[j], node k is grid_index[k] in the
+    # snapshot). All owners of a node sit in the same component, so owners()
+    # is already the component-local view and needs no membership filter.
 
-    adj = {e: set() for e in elems}
+    def __init__(self, snap, elems, label_bits, node_map=None):
+        self.snap = snap
+        self.elems = elems
+        self.elem_idx = snap.index(elems)
 
-    for owners in grid_to_elems.values():
-        if len(owners) > 1:
-            for i in range(len(owners)):
-                for j in range(i + 1, len(owners)):
-                    a, b = owners[i], owners[j]
-                    adj[a].add(b)
-                    adj[b].add(a)
+        local, nodes = shell_incidence(snap, self.elem_idx, node_map)
 
-    return adj
+        n = len(elems)
+        self.slot_elem = local
+        elem_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(local, minlength=n), out=elem_offsets[1:])
 
+        self.grid_index, elem_nodes = np.unique(nodes, return_inverse=True)
+        elem_nodes = elem_nodes.ravel()
 
-def connected_components(adj, elems):
-    visited = set()
-    comps = []
+        order = np.argsort(elem_nodes, kind="stable")
+        node_offsets = np.zeros(len(self.grid_index) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(elem_nodes, minlength=len(self.grid_index)),
+            out=node_offsets[1:]
+        )
+        self.first_slot = order[node_offsets[:-1]]
+
+        self.comp, self.n_comps = incidence_components(n, local, elem_nodes)
+        comp_order, comp_offsets = component_members(self.comp, self.n_comps)
+
+        arrays = {
+            "elem_offsets": elem_offsets,
+            "elem_nodes": elem_nodes,
+            "node_offsets": node_offsets,
+            "node_owners": local[order],
+            "comp_order": comp_order,
+            "comp_offsets": comp_offsets,
+            "label_bits": np.asarray(label_bits, dtype=np.uint8),
+        }
+        super().__init__(arrays)
 
-    for e in elems:
-        if e in visited:
-            continue
+    def attach_geometry(self, deck):
+        self.xyz = self.arrays["xyz"] = grid_coordinates(deck).rows(self.grid_index)
+        self.normals = self.arrays["normals"] = shell_geometry(deck).normals(self.elem_idx)
 
-        q = deque([e])
-        comp = []
-        visited.add(e)
+    def handles(self, local):
+        return [self.elems[j] for j in local]
 
-        while q:
-            u = q.popleft()
-            comp.append(u)
-            for v in adj[u]:
-                if v not in visited:
-                    visited.add(v)
-                    q.append(v)
+    def elem_ids(self, local):
+        return self.snap.elem_ids[self.elem_idx[local]].tolist()
 
-        comps.append(comp)
 
-    return comps
+# Distance (model units) below which weld nodes count as one node for
+# component and center detection, so separately meshed flanges that were
+# never merged still connect. The mesh itself is not touched; 0 disables.
+MERGE_TOL = 0.01
 
-def find_triplet_centers_for_group(comp, grid_to_elems, labels_map):
-    comp_set = set(comp)
-    centers = []
 
-    for gid, owners in grid_to_elems.items():
-        owners_in_comp = [e for e in owners if e in comp_set]
-        if not owners_in_comp:
-            continue
+def weld_node_map(deck, elems, tol=None):
+    return coincident_node_map(deck, shell_snapshot(deck).index(elems), tol)
 
-        cntA = cntB = cntT = cntC = 0
-        for e in owners_in_comp:
-            lbls = labels_map.get(e, set())
-            if "A" in lbls:
-                cntA += 1
-            if "B" in lbls:
-                cntB += 1
-            if "T" in lbls:
-                cntT += 1
-            if "C" in lbls:
-                cntC += 1
-
-        if cntA == 1 and cntB == 1 and cntT == 1 and cntC == 0:
-            centers.append(gid)
 
-    return centers
+def coincident_node_map(deck, elem_idx, tol=None):
+    # Virtual merge over the nodes of the snapshot shells elem_idx: dense
+    # node -> smallest dense node of its coincident cluster (identity for
+    # everything else). tol defaults to MERGE_TOL as set at call time.
+    if tol is None:
+        tol = MERGE_TOL
+    snap = shell_snapshot(deck)
+    node_map = np.arange(len(snap.grid_ids))
+    if tol <= 0:
+        return node_map
 
+    nodes = np.unique(shell_incidence(snap, elem_idx)[1])
+    u, v = coincident_pairs(grid_coordinates(deck).rows(nodes), tol)
+    node_map[nodes] = nodes[union_find_roots(len(nodes), u, v)]
 
-def classify_and_assign_group(
-    deck,
-    comp,
-    center_gid,
-    grid_to_elems,
-    labels_map,
-    elem_grids,
-    out_sets
-):
-    center_xyz = get_grid_coords(deck, center_gid)
-    if center_xyz is None:
-        print("  Skip Below Group for LAP Element Set : center node has no X1/X2/X3")
-        return False
+    merged = int((node_map[nodes] != nodes).sum())
+    if merged:
+        print(f"  Virtually merged {merged} coincident weld nodes (tol {tol})")
+    stage_note(merged_nodes=merged)
+    return node_map
 
-    owners_center = [e for e in grid_to_elems[center_gid] if e in comp]
 
-    a_elem = next((e for e in owners_center if "A" in labels_map.get(e, set())), None)
-    b_elem = next((e for e in owners_center if "B" in labels_map.get(e, set())), None)
-    t_elem = next((e for e in owners_center if "T" in labels_map.get(e, set())), None)
+def find_triplet_centers(inc):
+    # One pass over the incidence: per-node A/B/C/T owner counts, then the
+    # first qualifying node (in first-appearance order) of every component.
+    slot_bits = inc.label_bits[inc.slot_elem]
+    counts = {
+        lbl: np.bincount(
+            inc.elem_nodes,
+            weights=(slot_bits & bit) != 0,
+            minlength=len(inc.grid_index)
+        )
+        for lbl, bit in LABEL_BITS.items()
+    }
+    is_center = (
+        (counts["A"] == 1) & (counts["B"] == 1)
+        & (counts["T"] == 1) & (counts["C"] == 0)
+    )
 
-    if not a_elem or not b_elem or not t_elem:
-        print("  Skip Below Group for LAP Element Set : cannot resolve A/B/T shells at center")
-        return False
+    node_comp = inc.comp[inc.node_owners[inc.node_offsets[:-1]]]
+    cand = np.flatnonzero(is_center)
+    cand = cand[np.argsort(inc.first_slot[cand], kind="stable")]
+    comps, first = np.unique(node_comp[cand], return_index=True)
 
-    c_edge_gid = None
-    c_elem = None
+    centers = np.full(inc.n_comps, -1, dtype=np.int64)
+    centers[comps] = cand[first]
+    return centers
+
+
+def find_center_owners(inc, center):
+    owners_center = inc.owners(center).tolist()
+    return tuple(
+        next((e for e in owners_center if inc.has(e, lbl)), None)
+        for lbl in ("A", "B", "T")
+    )
 
-    for gid in elem_grids[t_elem]:
-        if gid == center_gid:
+
+def find_c_edge(inc, center, t_elem):
+    for node in inc.nodes_of(t_elem).tolist():
+        if node == center:
             continue
 
-        owners_n = [e for e in grid_to_elems.get(gid, []) if e in comp]
+        owners_n = inc.owners(node).tolist()
         if len(owners_n) != 2:
             continue
 
         if t_elem in owners_n:
             other = owners_n[0] if owners_n[1] == t_elem else owners_n[1]
-            if "C" in labels_map.get(other, set()):
-                c_edge_gid = gid
-                c_elem = other
-                break
+            if inc.has(other, "C"):
+                return node, other
 
-    if c_edge_gid is None or c_elem is None:
-        print("  Skip Below Group for LAP Element Set : no C-edge node (exactly t + C)")
-        return False
+    return None, None
 
-    c_edge_xyz = get_grid_coords(deck, c_edge_gid)
-    if c_edge_xyz is None:
-        print("  Skip Below Group for LAP Element Set : C-edge node has no X1/X2/X3")
-        return False
 
-    c_corner_gid = None
-    for gid in elem_grids[c_elem]:
-        if gid == c_edge_gid:
+def find_free_corner(inc, elem, skip_node):
+    for node in inc.nodes_of(elem).tolist():
+        if node == skip_node:
             continue
 
-        owners_n = [e for e in grid_to_elems.get(gid, []) if e in comp]
-        if len(owners_n) == 1 and owners_n[0] == c_elem:
-            c_corner_gid = gid
-            break
+        owners_n = inc.owners(node)
+        if len(owners_n) == 1 and owners_n[0] == elem:
+            return node
 
-    if c_corner_gid is None:
-        print("  Skip Below Group for LAP Element Set : no C-corner node (exactly one shell: the same side_C)")
-        return False
+    return None
 
-    c_corner_xyz = get_grid_coords(deck, c_corner_gid)
-    if c_corner_xyz is None:
-        print("  Skip Below Group for LAP Element Set : C-corner node has no X1/X2/X3")
-        return False
 
-    a_corner_gid = None
-    for gid in elem_grids[a_elem]:
-        if gid == center_gid:
-            continue
+def lap_decision(weld, comp, center):
+    # Pure classification of one component: (None, [(out set, members)]) or
+    # (reason it was skipped, None).
+    a_elem, b_elem, t_elem = find_center_owners(weld, center)
 
-        owners_n = [e for e in grid_to_elems.get(gid, []) if e in comp]
-        if len(owners_n) == 1 and owners_n[0] == a_elem:
-            a_corner_gid = gid
-            break
+    if a_elem is None or b_elem is None or t_elem is None:
+        return "cannot resolve A/B/T shells at center", None
 
-    if a_corner_gid is None:
-        print("  Skip Below Group for LAP Element Set : no A-corner node (exactly one shell: side_A)")
-        return False
+    c_edge, c_elem = find_c_edge(weld, center, t_elem)
 
-    a_corner_xyz = get_grid_coords(deck, a_corner_gid)
-    if a_corner_xyz is None:
-        print("  Skip Below Group for LAP Element Set : A-corner node has no X1/X2/X3")
-        return False
+    if c_edge is None or c_elem is None:
+        return "no C-edge node (exactly t + C)", None
 
-    center_C_vec = v_norm(v_sub(c_edge_xyz, center_xyz))
-    center_A_vec = v_norm(v_sub(a_corner_xyz, center_xyz))
-    edgeCorner_C = v_norm(v_sub(c_corner_xyz, c_edge_xyz))
+    c_corner = find_free_corner(weld, c_elem, c_edge)
 
-    if center_C_vec is None or center_A_vec is None or edgeCorner_C is None:
-        print("  Skip Below Group for LAP Element Set : vectors undefined")
-        return False
+    if c_corner is None:
+        return "no C-corner node (exactly one shell: the same side_C)", None
 
-    n_C = normal_of_shell(c_elem)
-    n_A = normal_of_shell(a_elem)
-    n_B = normal_of_shell(b_elem)
+    a_corner = find_free_corner(weld, a_elem, center)
 
-    if n_C is None or n_A is None or n_B is None:
-        print("  Skip Below Group for LAP Element Set : ANSA shell normals unavailable")
-        return False
+    if a_corner is None:
+        return "no A-corner node (exactly one shell: side_A)", None
+
+    xyz = weld.xyz[[center, c_edge, c_corner, a_corner]]
+    missing = np.isnan(xyz).any(axis=1)
+    for row, what in enumerate(("center node", "C-edge node", "C-corner node", "A-corner node")):
+        if missing[row]:
+            return f"{what} has no X1/X2/X3", None
+
+    # center -> C-edge, center -> A-corner, C-edge -> C-corner
+    vecs = v_norm(v_sub(xyz[[1, 3, 2]], xyz[[0, 0, 1]]))
+
+    if np.isnan(vecs).any():
+        return "vectors undefined", None
+
+    center_C_vec, center_A_vec, edgeCorner_C = vecs
+
+    normals = weld.normals[[c_elem, a_elem, b_elem]]
+
+    if np.isnan(normals).any():
+        return "shell normals undefined", None
 
-    same_C_vs_nC = (v_dot(center_C_vec, n_C) > EPS)
-    same_C_vs_nA = (v_dot(edgeCorner_C, center_A_vec) > EPS)
-    same_C_vs_nB = (v_dot(center_C_vec, n_B) > EPS)
-    same_A_vs_nB = (v_dot(center_A_vec, n_B) > EPS)
+    n_C, n_A, n_B = normals
 
-    comp_A = [e for e in comp if "A" in labels_map.get(e, set())]
-    comp_B = [e for e in comp if "B" in labels_map.get(e, set())]
-    comp_C = [e for e in comp if "C" in labels_map.get(e, set())]
+    same_C_vs_nC, same_C_vs_nA, same_C_vs_nB, same_A_vs_nB = (v_dot(
+        np.stack((center_C_vec, edgeCorner_C, center_C_vec, center_A_vec)),
+        np.stack((n_C, center_A_vec, n_B, n_B))
+    ) > EPS).tolist()
 
-    base.AddToSet(out_sets["M453" if same_C_vs_nC else "M450"], comp_C)
     key = (same_C_vs_nC, same_C_vs_nA, same_A_vs_nB)
 
     side_map = {
@@ -394,46 +1068,298 @@ def classify_and_assign_group(
 
     a_set_name, b_set_name = side_map[key]
 
-    base.AddToSet(out_sets[a_set_name], comp_A)
-    base.AddToSet(out_sets[b_set_name], comp_B)
+    return None, [
+        ("M453" if same_C_vs_nC else "M450", weld.members_with(comp, "C")),
+        (a_set_name, weld.members_with(comp, "A")),
+        (b_set_name, weld.members_with(comp, "B")),
+    ]
+
+
+# Worker processes for stream_decisions: 0 or 1 keeps the run serial.
+PARALLEL_WORKERS = 0
+# Components per block handed to the pool; at most two blocks are queued or
+# waiting to be consumed at any time.
+STREAM_BLOCK = 256
+
+_WORKER = {}
+
+
+def export_shared_arrays(arrays):
+    # Copy the arrays into one shared memory block; the manifest is enough
+    # to map them again in another process.
+    layout = {}
+    size = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        layout[name] = (size, arr.dtype.str, arr.shape)
+        size += -(-arr.nbytes // 64) * 64
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, arr in arrays.items():
+        offset, dtype, shape = layout[name]
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = arr
+
+    return shm, {"name": shm.name, "layout": layout}
+
+
+def attach_shared_arrays(manifest):
+    shm = shared_memory.SharedMemory(name=manifest["name"])
+    arrays = {
+        name: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+        for name, (offset, dtype, shape) in manifest["layout"].items()
+    }
+    return shm, arrays
+
+
+def _attach_worker(manifest):
+    _WORKER["shm"], arrays = attach_shared_arrays(manifest)
+    _WORKER["weld"] = WeldArrays(arrays)
+
+
+def _classify_in_worker(task):
+    decide, comp, center = task
+    return comp, decide(_WORKER["weld"], comp, center)
+
 
+def stream_decisions(weld, centers, decide, workers=None):
+    # (comp, decide(weld, comp, center)) for every component with a center,
+    # yielded one at a time in component order. With workers > 1 the arrays
+    # go to shared memory once and the components go to a process pool in
+    # consecutive blocks of STREAM_BLOCK, largest first within a block. The
+    # next block is queued while the current one is consumed, so at most two
+    # blocks of tasks and decisions are alive, whatever the deck size; the
+    # price is that largest-first only holds inside a block. workers
+    # defaults to PARALLEL_WORKERS as set at call time.
+    if workers is None:
+        workers = PARALLEL_WORKERS
+    comps = np.flatnonzero(centers >= 0)
+
+    if workers <= 1 or len(comps) < 2:
+        for c in comps.tolist():
+            yield c, decide(weld, c, centers[c])
+        return
+
+    sizes = np.diff(weld.comp_offsets)[comps]
+    blocks = [
+        (comps[k:k + STREAM_BLOCK], np.argsort(-sizes[k:k + STREAM_BLOCK], kind="stable"))
+        for k in range(0, len(comps), STREAM_BLOCK)
+    ]
+
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+
+    shm, manifest = export_shared_arrays(weld.arrays)
+    try:
+        with ctx.Pool(workers, initializer=_attach_worker, initargs=(manifest,)) as pool:
+
+            def submit(block, by_size):
+                return {
+                    c: pool.apply_async(_classify_in_worker, ((decide, c, int(centers[c])),))
+                    for c in block[by_size].tolist()
+                }
+
+            pending = submit(*blocks[0])
+            for k, (block, _) in enumerate(blocks):
+                current = pending
+                if k + 1 < len(blocks):
+                    pending = submit(*blocks[k + 1])
+                for c in block.tolist():
+                    yield c, current.pop(c).get()[1]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def apply_decision(inc, decision, out_sets, writer, stage):
+    skip, assignments = decision
+    if skip is not None:
+        print(f"  Skip Below Group for {stage} Element Set : {skip}")
+        return False
+
+    for name, members in assignments:
+        writer.add(out_sets[name], inc.handles(members))
     return True
 
 
-def run_lap_assignment(deck):
-    out_sets = ensure_clean_global_sets(deck, OUT_SETS)
+# Incremental runs: the outcome of every weld component is saved next to the
+# deck under a fingerprint of its topology. The next run classifies only the
+# components whose fingerprint is not in the saved state.
+INCREMENTAL = False
+
+CLASSIFICATION_STATE = "weld_classification.json"
+CLASSIFICATION_FORMAT = "weld-classification"
+CLASSIFICATION_VERSION = 1
+FINGERPRINT_DECIMALS = 6
+
+NO_CENTER = "no centers node found"
+
+
+def component_fingerprints(inc, decimals=FINGERPRINT_DECIMALS):
+    # Per component a digest of its sorted element IDs and labels and, per
+    # element, its grid IDs and rounded coordinates in connectivity order.
+    # Expects attach_geometry() to have run.
+    ids = inc.snap.elem_ids[inc.elem_idx].astype(np.int64)
+    order = np.lexsort((ids, inc.comp))
+    counts = np.diff(inc.elem_offsets)[order]
+    slot_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(counts, out=slot_offsets[1:])
+    slots = (
+        np.repeat(inc.elem_offsets[order] - slot_offsets[:-1], counts)
+        + np.arange(slot_offsets[-1])
+    )
+    nodes = inc.elem_nodes[slots]
+
+    ids, bits = ids[order], inc.label_bits[order]
+    grid_ids = inc.snap.grid_ids[inc.grid_index].astype(np.int64)[nodes]
+    xyz = np.ascontiguousarray(np.round(inc.xyz, decimals)[nodes] + 0.0)
+
+    fingerprints = []
+    for c in range(inc.n_comps):
+        a, b = inc.comp_offsets[c], inc.comp_offsets[c + 1]
+        sa, sb = slot_offsets[a], slot_offsets[b]
+        h = hashlib.blake2b(digest_size=16)
+        for part in (ids[a:b], bits[a:b], counts[a:b], grid_ids[sa:sb], xyz[sa:sb]):
+            h.update(part.tobytes())
+        fingerprints.append(h.hexdigest())
+    return fingerprints
+
+
+def classification_state_path(deck):
+    # Next to the open database when ANSA reports one, else the working dir.
+    db_name = getattr(base, "DataBaseName", None)
+    db_path = db_name() if db_name else None
+    folder = os.path.dirname(db_path) if db_path else os.getcwd()
+    return os.path.join(folder, CLASSIFICATION_STATE)
+
+
+def load_classification(path):
+    try:
+        with open(path) as fh:
+            state = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if state.get("format") != CLASSIFICATION_FORMAT:
+        return {}
+    if state.get("version") != CLASSIFICATION_VERSION:
+        return {}
+    return state.get("components", {})
+
+
+def save_classification(path, components):
+    with open(path, "w") as fh:
+        json.dump(
+            {
+                "format": CLASSIFICATION_FORMAT,
+                "version": CLASSIFICATION_VERSION,
+                "components": components,
+            },
+            fh
+        )
+
+
+def stored_decision(inc, comp, entry):
+    # A saved component outcome turned back into a decision on local indices.
+    if entry["skip"] is not None:
+        return entry["skip"], None
+
+    members = inc.members(comp)
+    ids = inc.snap.elem_ids[inc.elem_idx[members]]
+    order = np.argsort(ids, kind="stable")
+    members, ids = members[order], ids[order]
 
-    union_shells, labels_map = build_union_and_labels(deck)
+    return None, [
+        (name, members[dense_lookup(ids, elem_ids)])
+        for name, elem_ids in entry["sets"].items()
+    ]
+
+
+def decision_entry(inc, decision):
+    skip, assignments = decision
+    sets = {}
+    for name, members in assignments or ():
+        sets.setdefault(name, []).extend(inc.elem_ids(members))
+    return {
+        "skip": skip,
+        "sets": {name: sorted(set(ids)) for name, ids in sets.items()},
+    }
+
+
+def run_lap_assignment(deck, workers=None, state_path=None):
+    # With state_path, components whose fingerprint is already saved there
+    # keep their stored outcome and are not classified again; when a saved
+    # state exists the output sets are patched in place, not recreated.
+    previous = load_classification(state_path) if state_path else {}
+    writer = SetWriter(deck)
+
+    if previous:
+        registry = set_registry(deck)
+        out_sets = {name: registry.get_or_create(name, sid) for name, sid in OUT_SETS.items()}
+        for s in out_sets.values():
+            writer.add(s, ())
+    else:
+        out_sets = ensure_clean_global_sets(deck, OUT_SETS)
+
+    union_shells, labels = build_union_and_labels(deck)
     if not union_shells:
         print("No visible shells found across the lap sets.")
+        if previous:
+            writer.flush(patch=True)
+        if state_path:
+            save_classification(state_path, {})
         return
 
-    grid_to_elems, elem_grids = build_grid_to_elems(deck, union_shells)
-    adj = build_adjacency_any_grid(union_shells, elem_grids)
-    comps = connected_components(adj, union_shells)
+    node_map = weld_node_map(deck, union_shells)
+    inc = WeldIncidence(shell_snapshot(deck), union_shells, labels, node_map)
+    inc.attach_geometry(deck)
+    centers = find_triplet_centers(inc)
+
+    fingerprints = component_fingerprints(inc) if state_path else []
+    reused = {c for c, fp in enumerate(fingerprints) if fp in previous}
+    todo = centers.copy()
+    todo[list(reused)] = -1
+    stage_note(
+        elements=len(union_shells),
+        components=inc.n_comps,
+        centers=int((centers >= 0).sum()),
+        reused=len(reused)
+    )
+    if state_path:
+        print(f"  Reused {len(reused)} unchanged weld groups, "
+              f"classifying {inc.n_comps - len(reused)}")
+
+    # Components are taken one at a time; a decision goes to the writer
+    # (and the saved state) as soon as it is made and is then dropped.
+    entries = {}
+
+    with contextlib.closing(stream_decisions(inc, todo, lap_decision, workers)) as stream:
+        for comp in range(inc.n_comps):
+            i = comp + 1
+            if comp in reused:
+                decision = stored_decision(inc, comp, previous[fingerprints[comp]])
+                if decision[0] is None:
+                    apply_decision(inc, decision, out_sets, writer, "LAP")
+
+            elif centers[comp] < 0:
+                print(f"  Skip Below Group for LAP Element Set : {NO_CENTER}")
+                print(f"  Orphan Element Group [{i}] (skip)")
+                decision = (NO_CENTER, None)
 
-    for i, comp in enumerate(comps, start=1):
-        comp = [e for e in comp]
-        centers = find_triplet_centers_for_group(comp, grid_to_elems, labels_map)
+            else:
+                _, decision = next(stream)
+                ok = apply_decision(inc, decision, out_sets, writer, "LAP")
 
-        if not centers:
-            print(f"  Skip Below Group for LAP Element Set : no centers node found")
-            print(f"  Orphan Element Group [{i}] (skip)")
-            continue
+                if not ok:
+                    print(f"Orphan Element Group [{i}] (skip)")
 
-        center_gid = centers[0]
-        ok = classify_and_assign_group(
-            deck,
-            comp,
-            center_gid,
-            grid_to_elems,
-            labels_map,
-            elem_grids,
-            out_sets
-        )
+            if state_path:
+                entries[fingerprints[comp]] = decision_entry(inc, decision)
 
-        if not ok:
-            print(f"Orphan Element Group [{i}] (skip)")
+    counts = writer.flush(patch=bool(previous))
+    stage_note(assigned=counts)
+    report_set_counts(counts)
+
+    if state_path:
+        save_classification(state_path, entries)
 
 
 SET_A = "Lap_Joint_delt_Side_A"
@@ -453,18 +1379,11 @@ OUT_SETS = {
 EPS = 1e-9
 
 def get_set_by_name_T(deck, name):
-    for s in base.CollectEntities(deck, None, "SET"):
-        card = base.GetEntityCardValues(deck, s, ("Name", "SID"))
-        if card and card.get("Name") == name:
-            return s
-    return None
+    return set_registry(deck).get(name)
 
 
 def get_or_create_global_set_T(deck, name, set_id):
-    s = get_set_by_name_T(deck, name)
-    if s:
-        return s
-    return base.CreateEntity(deck, "SET", {"Name": name, "SID": set_id})
+    return set_registry(deck).get_or_create(name, set_id)
 
 
 def collect_visible_shells_T(deck, container_entity):
@@ -478,59 +1397,15 @@ def collect_visible_shells_T(deck, container_entity):
 
 
 def get_elem_grids_T(deck, elem):
-    keys = ("G1", "G2", "G3", "G4", "G5", "G6", "G7", "G8")
-    vals = base.GetEntityCardValues(deck, elem, keys)
-    grids = [vals[k] for k in keys if k in vals and vals[k]]
-    return [gid for gid in grids if gid and gid != 0]
+    return shell_snapshot(deck).grids(elem)
 
 
 def get_grid_coords_T(deck, grid_id):
     if not grid_id or grid_id == 0:
         return None
 
-    grid = base.GetEntity(deck, "GRID", grid_id)
-    if not grid:
-        return None
-
-    card = base.GetEntityCardValues(deck, grid, ("X1", "X2", "X3"))
-    x1 = card.get("X1")
-    x2 = card.get("X2")
-    x3 = card.get("X3")
-
-    if x1 is None or x2 is None or x3 is None:
-        return None
-
-    return (x1, x2, x3)
-
-
-def v_sub_T(a, b):
-    if a is None or b is None:
-        return None
-    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
-
-
-def v_len_T(a):
-    if a is None:
-        return 0.0
-    return math.sqrt(a[0]*a[0] + a[1]*a[1] + a[2]*a[2])
-
-
-def v_norm_T(a):
-    L = v_len_T(a)
-    if L <= EPS:
-        return None
-    return (a[0]/L, a[1]/L, a[2]/L)
-
-
-def v_dot_T(a, b):
-    if a is None or b is None:
-        return None
-    return a[0]*b[0] + a[1]*b[1] + a[2]*b[2)
-
+    return grid_coordinates(deck).coord(grid_id)
 
-def normal_of_shell_T(elem):
-    n = base.GetNormalVectorOfShell(elem)
-    return v_norm_T(n) if n is not None else None
 
 def build_union_and_labels_T(deck):
     sets = {
@@ -544,451 +1419,281 @@ def build_union_and_labels_T(deck):
         if not s:
             raise ValueError(f"SET for label '{lbl}' not found.")
 
-    shells_by_label = {
-        lbl: collect_visible_shells_T(deck, s)
-        for lbl, s in sets.items()
-    }
-
-    union_shells = []
-    labels_map = {}
-    seen = set()
-
-    for lbl in ("A", "B", "C", "T"):
-        for e in shells_by_label[lbl]:
-            if e not in seen:
-                seen.add(e)
-                union_shells.append(e)
-                labels_map.setdefault(e, set()).add(lbl)
-
-    return union_shells, labels_map
-
-
-def build_grid_to_elems_T(deck, elems):
-    elem_grids = {}
-    grid_to_elems = defaultdict(list)
-
-    for e in elems:
-        grids = get_elem_grids_T(deck, e)
-        elem_grids[e] = grids
-        for gid in grids:
-            grid_to_elems[gid].append(e)
-
-    return grid_to_elems, elem_grids
-
-
-def build_adjacency_any_grid_T(elems, elem_grids):
-    grid_to_elems = defaultdict(list)
-
-    for e, grids in elem_grids.items():
-        for g in grids:
-            grid_to_elems[g].append(e)
-
-    adj = {e: set() for e in elems}
-
-    for owners in grid_to_elems.values():
-        if len(owners) > 1:
-            for i in range(len(owners)):
-                for j in range(i + 1, len(owners)):
-                    a, b = owners[i], owners[j]
-                    adj[a].add(b)
-                    adj[b].add(a)
-
-    return adj
+    # One label per shell: the first of A, B, C, T whose set holds it.
+    union, mask = set_membership(deck, [sets[lbl] for lbl in LABELS])
+    return shell_snapshot(deck).handles(union), lowest_bit(mask[union])
 
-def connected_components_T(adj, elems):
-    visited = set()
-    comps = []
 
-    for e in elems:
-        if e in visited:
-            continue
-
-        q = deque([e])
-        comp = []
-        visited.add(e)
-
-        while q:
-            u = q.popleft()
-            comp.append(u)
-            for v in adj[u]:
-                if v not in visited:
-                    visited.add(v)
-                    q.append(v)
-
-        comps.append(comp)
+def t_decision(weld, comp, center):
+    # T-joint counterpart of lap_decision.
+    a_elem, b_elem, t_elem = find_center_owners(weld, center)
 
-    return comps
+    if a_elem is None or b_elem is None or t_elem is None:
+        return "cannot resolve A/B/T shells at center", None
 
-def find_triplet_centers_for_group_T(comp, grid_to_elems, labels_map):
-    comp_set = set(comp)
-    centers = []
+    c_edge, c_elem = find_c_edge(weld, center, t_elem)
 
-    for gid, owners in grid_to_elems.items():
-        owners_in_comp = [e for e in owners if e in comp_set]
-        if not owners_in_comp:
-            continue
+    if c_edge is None or c_elem is None:
+        return "no C-edge node (exactly t + C)", None
 
-        cntA = cntB = cntT = cntC = 0
-        for e in owners_in_comp:
-            lbls = labels_map.get(e, set())
-            if "A" in lbls: cntA += 1
-            if "B" in lbls: cntB += 1
-            if "T" in lbls: cntT += 1
-            if "C" in lbls: cntC += 1
+    a_corner = find_free_corner(weld, a_elem, center)
 
-        if cntA == 1 and cntB == 1 and cntT == 1 and cntC == 0:
-            centers.append(gid)
+    if a_corner is None:
+        return "no A-corner GRID (exactly one shell: Side_A)", None
 
-    return centers
+    xyz = weld.xyz[[center, c_edge, a_corner]]
+    missing = np.isnan(xyz).any(axis=1)
+    for row, what in enumerate(("center node", "C-edge node", "A-corner GRID")):
+        if missing[row]:
+            return f"{what} has no X1/X2/X3", None
 
-def classify_and_assign_group_T(
-    deck,
-    comp,
-    center_gid,
-    grid_to_elems,
-    labels_map,
-    elem_grids,
-    out_sets
-):
-    center_xyz = get_grid_coords_T(deck, center_gid)
-    if center_xyz is None:
-        print("  Skip Below Group for T Element Set : center node has no X1/X2/X3")
-        return False
+    # center -> C-edge, center -> A-corner
+    vecs = v_norm(v_sub(xyz[[1, 2]], xyz[0]))
 
-    owners_center = [e for e in grid_to_elems[center_gid] if e in comp]
+    if np.isnan(vecs).any():
+        return "vectors undefined", None
 
-    a_elem = next((e for e in owners_center if "A" in labels_map.get(e, set())), None)
-    b_elem = next((e for e in owners_center if "B" in labels_map.get(e, set())), None)
-    t_elem = next((e for e in owners_center if "T" in labels_map.get(e, set())), None)
+    center_C_vec, center_A_vec = vecs
 
-    if not a_elem or not b_elem or not t_elem:
-        print("  Skip Below Group for T Element Set : cannot resolve A/B/T shells at center")
-        return False
+    normals = weld.normals[[t_elem, a_elem, b_elem]]
 
-    c_edge_gid = None
-    c_elem = None
+    if np.isnan(normals).any():
+        return "shell normals undefined", None
 
-    for gid in elem_grids[t_elem]:
-        if gid == center_gid:
-            continue
+    n_T, n_A, n_B = normals
 
-        owners_n = [e for e in grid_to_elems.get(gid, []) if e in comp]
-        if len(owners_n) != 2:
-            continue
+    same_C_vs_nA, same_A_vs_nT, same_A_vs_nB = (v_dot(
+        np.stack((center_C_vec, center_A_vec, n_A)),
+        np.stack((n_A, n_T, n_B))
+    ) > EPS).tolist()
 
-        if t_elem in owners_n:
-            other = owners_n[0] if owners_n[1] == t_elem else owners_n[1]
-            if "C" in labels_map.get(other, set()):
-                c_edge_gid = gid
-                c_elem = other
-                break
-
-    if c_edge_gid is None or c_elem is None:
-        print("  Skip Below Group for T Element Set : no C-edge node (exactly t + C)")
-        return False
-
-    c_edge_xyz = get_grid_coords_T(deck, c_edge_gid)
-    if c_edge_xyz is None:
-        print("  Skip Below Group for T Element Set : C-edge node has no X1/X2/X3")
-        return False
-    a_corner_gid = None
-    for gid in elem_grids[a_elem]:
-        if gid == center_gid:
-            continue
-
-        owners_n = [e for e in grid_to_elems.get(gid, []) if e in comp]
-        if len(owners_n) == 1 and owners_n[0] == a_elem:
-            a_corner_gid = gid
-            break
-
-    if a_corner_gid is None:
-        print("  Skip Below Group for T Element Set : no A-corner GRID (exactly one shell: Side_A)")
-        return False
-
-    a_corner_xyz = get_grid_coords_T(deck, a_corner_gid)
-    if a_corner_xyz is None:
-        print("  Skip Below Group for T Element Set : A-corner GRID has no X1/X2/X3")
-        return False
-
-    center_C_vec = v_norm_T(v_sub_T(c_edge_xyz, center_xyz))
-    center_A_vec = v_norm_T(v_sub_T(a_corner_xyz, center_xyz))
-
-    if center_C_vec is None or center_A_vec is None:
-        print("  Skip Below Group for T Element Set : vectors undefined")
-        return False
-
-    n_T = normal_of_shell_T(t_elem)
-    n_A = normal_of_shell_T(a_elem)
-    n_B = normal_of_shell_T(b_elem)
-
-    if n_T is None or n_A is None or n_B is None:
-        print("  Skip Below Group for T Element Set : ANSA shell normals unavailable")
-        return False
-
-    same_C_vs_nA = (v_dot_T(center_C_vec, n_A) > EPS)
-    same_A_vs_nT = (v_dot_T(center_A_vec, n_T) > EPS)
-    same_A_vs_nB = (v_dot_T(n_A, n_B) > EPS)
-
-    comp_A = [e for e in comp if "A" in labels_map.get(e, set())]
-    comp_B = [e for e in comp if "B" in labels_map.get(e, set())]
-    comp_T = [e for e in comp if "T" in labels_map.get(e, set())]
+    comp_A = weld.members_with(comp, "A")
+    comp_B = weld.members_with(comp, "B")
+    comp_T = weld.members_with(comp, "T")
+    assignments = []
 
     if same_A_vs_nB:
 
         if same_C_vs_nA and same_A_vs_nT:
-            base.AddToSet(out_sets["M203"], comp_A)
-            base.AddToSet(out_sets["M204"], comp_B)
-            base.AddToSet(out_sets["M205"], comp_T)
+            assignments.append(("M203", comp_A))
+            assignments.append(("M204", comp_B))
+            assignments.append(("M205", comp_T))
 
         elif same_C_vs_nA and (not same_A_vs_nT):
-            base.AddToSet(out_sets["M201"], comp_A)
-            base.AddToSet(out_sets["M202"], comp_B)
-            base.AddToSet(out_sets["M205"], comp_T)
+            assignments.append(("M201", comp_A))
+            assignments.append(("M202", comp_B))
+            assignments.append(("M205", comp_T))
 
         elif (not same_C_vs_nA) and (not same_A_vs_nT):
-            base.AddToSet(out_sets["M201"], comp_A)
-            base.AddToSet(out_sets["M202"], comp_B)
-            base.AddToSet(out_sets["M205"], comp_T)
+            assignments.append(("M201", comp_A))
+            assignments.append(("M202", comp_B))
+            assignments.append(("M205", comp_T))
 
         else:
-            base.AddToSet(out_sets["M202"], comp_A)
-            base.AddToSet(out_sets["M204"], comp_B)
-            base.AddToSet(out_sets["M205"], comp_T)
+            assignments.append(("M202", comp_A))
+            assignments.append(("M204", comp_B))
+            assignments.append(("M205", comp_T))
 
     else:
-        base.AddToSet(out_sets["M207"], comp_T)
+        assignments.append(("M207", comp_T))
 
         if same_C_vs_nA and same_A_vs_nT:
-            base.AddToSet(out_sets["M201"], comp_A)
-            base.AddToSet(out_sets["M204"], comp_B)
+            assignments.append(("M201", comp_A))
+            assignments.append(("M204", comp_B))
 
         elif same_C_vs_nA and (not same_A_vs_nT):
-            base.AddToSet(out_sets["M201"], comp_A)
-            base.AddToSet(out_sets["M202"], comp_B)
+            assignments.append(("M201", comp_A))
+            assignments.append(("M202", comp_B))
 
         elif (not same_C_vs_nA) and (not same_A_vs_nT):
-            base.AddToSet(out_sets["M202"], comp_A)
-            base.AddToSet(out_sets["M203"], comp_B)
+            assignments.append(("M202", comp_A))
+            assignments.append(("M203", comp_B))
 
         else:
-            base.AddToSet(out_sets["M202"], comp_A)
-            base.AddToSet(out_sets["M201"], comp_B)
+            assignments.append(("M202", comp_A))
+            assignments.append(("M201", comp_B))
 
-    return True
+    return None, assignments
 
-def run_assignment(deck):
+def run_assignment(deck, workers=None):
 
-    union_shells, labels_map = build_union_and_labels(deck)
+    union_shells, labels = build_union_and_labels(deck)
     if not union_shells:
         print("No visible shells found across the four sets.")
         return
 
-    grid_to_elems, elem_grids = build_grid_to_elems(deck, union_shells)
-    adj = build_adjacency_any_grid(union_shells, elem_grids)
-    comps = connected_components(adj, union_shells)
+    node_map = weld_node_map(deck, union_shells)
+    inc = WeldIncidence(shell_snapshot(deck), union_shells, labels, node_map)
+    inc.attach_geometry(deck)
+    centers = find_triplet_centers(inc)
+    writer = SetWriter(deck)
+    stage_note(
+        elements=len(union_shells),
+        components=inc.n_comps,
+        centers=int((centers >= 0).sum())
+    )
 
     out_sets = {
-        name: get_or_create_global_set(deck, name, OUT_SETS[name])
+        name: get_or_create_global_set_T(deck, name, OUT_SETS[name])
         for name in OUT_SETS
     }
 
-    for i, comp in enumerate(comps, start=1):
-        ids = [e._id for e in comp]
-
-        centers = find_triplet_centers_for_group(
-            comp,
-            grid_to_elems,
-            labels_map
-        )
-
-        if not centers:
-            print("  Skip Below Group for T Element Set : no centers node found")
-            print(f"  Critical Element Group [{i}] ({ids})")
-            continue
-
-        center_gid = centers[0]
-
-        ok = classify_and_assign_group(
-            deck,
-            comp,
-            center_gid,
-            grid_to_elems,
-            labels_map,
-            elem_grids,
-            out_sets
-        )
-
-        if not ok:
-            print(f"Critical Element Group [{i}] ({ids})")
-
-def get_shell_nodes(deck, elem):
-    keys = ("G1", "G2", "G3", "G4", "G5", "G6", "G7", "G8")
-    vals = base.GetEntityCardValues(deck, elem, keys)
-    return [vals[k] for k in keys if k in vals and vals[k]]
-
-
-def build_node_cache(deck, elems):
-    elem_nodes = {}
-    elem_nodes_set = {}
-
-    for e in elems:
-        nodes = get_shell_nodes(deck, e)
-        elem_nodes[e] = nodes
-        elem_nodes_set[e] = set(nodes)
-
-    return elem_nodes, elem_nodes_set
-
-
-def shared_node_count(e1, e2, elem_nodes_set):
-    return len(elem_nodes_set[e1].intersection(elem_nodes_set[e2]))
-
-
-def build_adjacency_any_node(elems, elem_nodes):
-    node_to_elems = defaultdict(list)
-
-    for e, nodes in elem_nodes.items():
-        for n in nodes:
-            node_to_elems[n].append(e)
-
-    adj = {e: set() for e in elems}
-
-    for owners in node_to_elems.values():
-        if len(owners) > 1:
-            for i in range(len(owners)):
-                for j in range(i + 1, len(owners)):
-                    a, b = owners[i], owners[j]
-                    adj[a].add(b)
-                    adj[b].add(a)
-
-    return adj
-
-def build_edge_adjacency(elems, elem_nodes):
-    node_to_elems = defaultdict(list)
-
-    for e, nodes in elem_nodes.items():
-        for n in nodes:
-            node_to_elems[n].append(e)
-
-    pair_count = defaultdict(int)
-
-    for owners in node_to_elems.values():
-        for i in range(len(owners)):
-            for j in range(i + 1, len(owners)):
-                a, b = owners[i], owners[j]
-                key = (a, b) if id(a) < id(b) else (b, a)
-                pair_count[key] += 1
-
-    adj_edge = {e: set() for e in elems}
-
-    for (a, b), cnt in pair_count.items():
-        if cnt >= 2:
-            adj_edge[a].add(b)
-            adj_edge[b].add(a)
-
-    return adj_edge
-
-
-def connected_components(adj_any, elems):
-    visited = set()
-    comps = []
-
-    for e in elems:
-        if e in visited:
-            continue
-
-        q = deque([e])
-        comp = []
-        visited.add(e)
-
-        while q:
-            u = q.popleft()
-            comp.append(u)
-            for v in adj_any[u]:
-                if v not in visited:
-                    visited.add(v)
-                    q.append(v)
-
-        comps.append(comp)
-
-    return comps
-
-
-def pick_corner_elements(comp, adj_edge):
-    corners = [
-        e for e in comp
-        if len(adj_edge[e].intersection(comp)) == 2
-    ]
-    return corners
-
-
-def walk_side_from_corner(corner, adj_edge, elem_nodes_set):
-    neighbors = list(adj_edge[corner])
+    with contextlib.closing(stream_decisions(inc, centers, lap_decision, workers)) as stream:
+        for comp in range(inc.n_comps):
+            i = comp + 1
 
-    if len(neighbors) < 1:
-        return [corner]
-
-    candidates = []
-
-    first_choices = neighbors if len(neighbors) == 2 else [neighbors[0]]
-
-    for first in first_choices:
-        ok_choice = False
-
-        for nn in adj_edge[first]:
-            if nn == corner:
+            if centers[comp] < 0:
+                print("  Skip Below Group for T Element Set : no centers node found")
+                print(f"  Critical Element Group [{i}] ({inc.elem_ids(inc.members(comp))})")
                 continue
 
-            if shared_node_count(nn, corner, elem_nodes_set) == 0:
-                ok_choice = True
-                break
-
-        if not ok_choice:
-            pass
-        
-            path = [corner, first]
-    prev = corner
-    cur = first
-
-    while True:
-        nexts = [n for n in adj_edge[cur] if n != prev]
-        nexts = [
-            n for n in nexts
-            if shared_node_count(n, prev, elem_nodes_set) == 0
-        ]
-
-        if not nexts:
-            break
-
-        nxt = nexts[0]
-        path.append(nxt)
-        prev, cur = cur, nxt
-
-    candidates.append(path)
-
-    if not candidates:
-        return [corner]
+            _, decision = next(stream)
+            ok = apply_decision(inc, decision, out_sets, writer, "LAP")
 
-    return max(candidates, key=len)
+            if not ok:
+                print(f"Critical Element Group [{i}] ({inc.elem_ids(inc.members(comp))})")
 
+    counts = writer.flush()
+    stage_note(assigned=counts)
+    report_set_counts(counts)
 
-def extract_side_1_for_component(comp, adj_edge, elem_nodes_set):
-    corners = pick_corner_elements(comp, adj_edge)
-
-    if corners:
-        side1 = walk_side_from_corner(
-            corners[0],
-            adj_edge,
-            elem_nodes_set
-        )
-    else:
-        start = sorted(comp, key=lambda e: e._id)[0]
-        side1 = walk_side_from_corner(
-            start,
-            adj_edge,
-            elem_nodes_set
+def get_shell_nodes(deck, elem):
+    return shell_snapshot(deck).grids(elem)
+
+
+def build_edge_adjacency(deck, elems, node_map=None):
+    snap = shell_snapshot(deck)
+    return EdgeIndex(snap, snap.index(elems), node_map)
+
+
+class QuadStrips:
+    # Strip topology of the quads in an EdgeIndex. Quad j has two pairs of
+    # opposite edges; opposite[j, p] holds the shells across edges p and
+    # p + 2 (-1 where the edge is free or shared by more than two shells).
+    # The along pair runs down the row, the other one crosses the strip to
+    # across[j]. Rows are the components of mutual along links; anything
+    # that is not a quad, or has no clear row direction, is a row of its own.
+
+    def __init__(self, edges):
+        self.edges = edges
+        n = len(edges.elem_idx)
+        quads = np.flatnonzero(np.diff(edges.elem_edge_offsets) == 4)
+
+        slot = edges.elem_edge_offsets[quads][:, None] + np.arange(4)
+        k = edges.slot_edge[slot]
+        first = edges.edge_offsets[k]
+        second = edges.edge_elems[np.minimum(first + 1, len(edges.edge_elems) - 1)]
+        nb = np.where(
+            edges.edge_count[k] == 2,
+            edges.edge_elems[first] + second - quads[:, None],
+            -1
         )
-
-    return side1
+        nb[nb == quads[:, None]] = -1
+
+        opposite = np.full((n, 2, 2), -1, dtype=np.int64)
+        opposite[quads] = nb[:, [[0, 2], [1, 3]]]
+        self.opposite = opposite
+
+        # Interior quads have both shells of one pair, a chain end only one
+        # shared edge at all. Strip corners have one on each pair.
+        shared = (opposite >= 0).sum(axis=2)
+        s0, s1 = shared[quads, 0], shared[quads, 1]
+        along = np.full(n, -1, dtype=np.int64)
+        along[quads[(s0 == 2) & (s1 <= 1) | (s0 == 1) & (s1 == 0)]] = 0
+        along[quads[(s1 == 2) & (s0 <= 1) | (s1 == 1) & (s0 == 0)]] = 1
+        self.along = along
+        self._resolve_corners(quads[(s0 == 1) & (s1 == 1)])
+
+        has = np.flatnonzero(along >= 0)
+        cross = opposite[has, 1 - along[has]]
+        self.across = np.full(n, -1, dtype=np.int64)
+        self.across[has] = np.where((cross >= 0).sum(axis=1) == 1, cross.max(axis=1), -1)
+
+        u = np.repeat(has, 2)
+        v = opposite[has, along[has]].ravel()
+        keep = v >= 0
+        u, v = u[keep], v[keep]
+        mutual = (along[v] >= 0) & (
+            opposite[v, np.maximum(along[v], 0)] == u[:, None]
+        ).any(axis=1)
+        self.row = union_find_roots(n, u[mutual], v[mutual])
+
+    def _resolve_corners(self, corners):
+        # A corner takes its direction from a neighbour that already has one:
+        # the pair that neighbour sits on is along if the neighbour lists the
+        # corner as along, across otherwise. With the corner on pair p of its
+        # own and on pair q of the neighbour that is along = along[nb] ^ p ^ q.
+        # Corners next to a resolved quad are set first (pair 0 winning a
+        # tie), then one queue pass over the corner links carries the
+        # direction on. Clusters of corners no resolved quad reaches (2 x 2
+        # strips) get their lowest shell seeded first.
+        along, opposite = self.along, self.opposite
+        n = len(along)
+
+        nb = opposite[corners].max(axis=2)
+        flip = np.arange(2) ^ (opposite[nb, 0] != corners[:, None, None]).all(axis=2)
+        for p in (0, 1):
+            m = nb[:, p]
+            todo = (m >= 0) & (along[m] >= 0) & (along[corners] < 0)
+            along[corners[todo]] = along[m[todo]] ^ flip[todo, p]
+
+        # Corner links grouped by the neighbour they point at.
+        link_corner = np.repeat(corners, 2)
+        link_nb = nb.ravel()
+        keep = link_nb >= 0
+        order = np.argsort(link_nb[keep], kind="stable")
+        link_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(link_nb[keep], minlength=n), out=link_offsets[1:])
+
+        link_offsets = link_offsets.tolist()
+        link_corner = link_corner[keep][order].tolist()
+        link_flip = flip.ravel()[keep][order].tolist()
+        direction = along.tolist()
+
+        def spread(queue):
+            for m in queue:
+                for k in range(link_offsets[m], link_offsets[m + 1]):
+                    c = link_corner[k]
+                    if direction[c] < 0:
+                        direction[c] = direction[m] ^ link_flip[k]
+                        queue.append(c)
+            along[corners] = np.array(direction)[corners]
+
+        spread(corners[along[corners] >= 0].tolist())
+
+        rest = corners[along[corners] < 0]
+        if len(rest):
+            in_rest = np.zeros(n + 1, dtype=bool)
+            in_rest[rest] = True
+            u = np.repeat(rest, 2)
+            v = opposite[rest].max(axis=2).ravel()
+            pair = in_rest[v]
+            roots = union_find_roots(n, u[pair], v[pair])
+            seeds = rest[roots[rest] == rest]
+            for c in seeds.tolist():
+                direction[c] = 0
+            spread(seeds.tolist())
+
+    def sides(self, labels, n_comps):
+        # Side A of a component is the row through its first corner (edge
+        # degree 2, in component order), or through its lowest snapshot
+        # shell when it has none; Side B is the rest of the component.
+        order, offsets = component_members(labels, n_comps)
+        comp_of = labels[order]
+        corner = self.edges.degree()[order] == 2
+
+        start = np.full(n_comps, -1, dtype=np.int64)
+        comps, first = np.unique(comp_of[corner], return_index=True)
+        start[comps] = order[np.flatnonzero(corner)[first]]
+
+        rest = np.flatnonzero(start < 0)
+        if len(rest):
+            by_idx = np.lexsort((self.edges.elem_idx[order], comp_of))
+            comps, first = np.unique(comp_of[by_idx], return_index=True)
+            start[rest] = order[by_idx[first]][rest]
+
+        side_a = self.row[order] == self.row[start[comp_of]]
+        return order[side_a], order[~side_a]
 
 
 def create_global_sets_for_double_chains(deck, set_name):
@@ -1003,49 +1708,26 @@ def create_global_sets_for_double_chains(deck, set_name):
         print("No visible SHELL elements found.")
         return None, None
 
-    elem_nodes, elem_nodes_set = build_node_cache(deck, shells)
-    adj_any = build_adjacency_any_node(shells, elem_nodes)
-    adj_edge = build_edge_adjacency(shells, elem_nodes)
-
-    comps = connected_components(adj_any, shells)
-
-    set1 = base.CreateEntity(deck, "SET", {"Name": f"{set_name}_Side_A"})
-    set2 = base.CreateEntity(deck, "SET", {"Name": f"{set_name}_Side_B"})
-
-    total_s1 = 0
-    total_s2 = 0
-
-    for i, comp in enumerate(comps, start=1):
-        sub_adj_edge = {
-            e: adj_edge[e].intersection(comp)
-            for e in comp
-        }
-
-        side1 = extract_side_1_for_component(
-            comp,
-            sub_adj_edge,
-            elem_nodes_set
-        )
-
-        side1_set = set(side1)
-        side2 = [e for e in comp if e not in side1_set]
+    node_map = weld_node_map(deck, shells)
+    edges = build_edge_adjacency(deck, shells, node_map)
+    labels, n_comps = label_components(edges.snap, edges.elem_idx, node_map)
 
-        if side1:
-            base.AddToSet(set1, side1)
-        if side2:
-            base.AddToSet(set2, side2)
+    registry = set_registry(deck)
+    set1 = registry.create({"Name": f"{set_name}_Side_A"})
+    set2 = registry.create({"Name": f"{set_name}_Side_B"})
+    writer = SetWriter(deck)
 
-        total_s1 += len(side1)
-        total_s2 += len(side2)
+    side1, side2 = QuadStrips(edges).sides(labels, n_comps)
+    writer.add(set1, [shells[e] for e in side1.tolist()])
+    writer.add(set2, [shells[e] for e in side2.tolist()])
 
+    counts = writer.flush()
+    stage_note(assigned=counts)
+    report_set_counts(counts)
     return set1, set2
 
 def get_set_by_name(deck, name):
-    for s in base.CollectEntities(deck, None, "SET"):
-        card = base.GetEntityCardValues(deck, s, ("Name",))
-        if card and card.get("Name") == name:
-            return s
-    return None
+    return set_registry(deck).get(name)
 
 
 def collect_visible_shells(deck, container_entity=None):
@@ -1058,27 +1740,33 @@ def collect_visible_shells(deck, container_entity=None):
     )
 
 
-def cache_nodes(deck, elems):
-    elem_nodes = {}
-    elem_nodes_set = {}
+ROLE_T = 1
+ROLE_A = 2
+ROLE_B = 4
+
 
-    keys = ("G1", "G2", "G3", "G4", "G5", "G6", "G7", "G8")
+def find_side_C(snap, ring_index, idx_T, idx_A, idx_B):
+    # Side C = edge neighbours of T that are neither T/A/B themselves nor
+    # edge neighbours of any A or B shell. Only the node 1-ring of T plus
+    # the weld sets is indexed, so the cost follows the weld sets.
+    scope = np.unique(np.concatenate([
+        idx_T, idx_A, idx_B, ring_index.ring(idx_T)
+    ]))
+    edges = EdgeIndex(snap, scope)
 
-    for e in elems:
-        vals = base.GetEntityCardValues(deck, e, keys)
-        nodes = [vals[k] for k in keys if k in vals and vals[k]]
-        elem_nodes[e] = nodes
-        elem_nodes_set[e] = set(nodes)
+    role = np.zeros(len(scope), dtype=np.uint8)
+    for idx, bit in ((idx_T, ROLE_T), (idx_A, ROLE_A), (idx_B, ROLE_B)):
+        role[np.searchsorted(scope, idx)] |= bit
 
-    return elem_nodes, elem_nodes_set
+    src = np.repeat(np.arange(len(scope)), edges.degree())
+    dst = edges.adjacency()[1]
 
+    near_T = np.zeros(len(scope), dtype=bool)
+    near_T[dst[(role[src] & ROLE_T) != 0]] = True
+    near_AB = np.zeros(len(scope), dtype=bool)
+    near_AB[src[(role[dst] & (ROLE_A | ROLE_B)) != 0]] = True
 
-def shares_at_least_two_nodes(e, others, elem_nodes_set):
-    e_nodes = elem_nodes_set[e]
-    for o in others:
-        if len(e_nodes.intersection(elem_nodes_set[o])) >= 2:
-            return True
-    return False
+    return scope[near_T & ~near_AB & (role == 0)]
 
 
 def build_T_joint_side_C(
@@ -1103,44 +1791,23 @@ def build_T_joint_side_C(
     shells_T = collect_visible_shells(deck, set_T)
     shells_A = collect_visible_shells(deck, set_A)
     shells_B = collect_visible_shells(deck, set_B)
-    all_visible_shells = collect_visible_shells(deck, None)
-
-    nodes_T, nodes_T_set = cache_nodes(deck, shells_T)
-    nodes_A, nodes_A_set = cache_nodes(deck, shells_A)
-    nodes_B, nodes_B_set = cache_nodes(deck, shells_B)
-    nodes_all, nodes_all_set = cache_nodes(deck, all_visible_shells)
-
-    in_T = set(shells_T)
-    in_A = set(shells_A)
-    in_B = set(shells_B)
-
-    exclude = in_T | in_A | in_B
-
-    candidates = [
-        e for e in all_visible_shells
-        if e not in exclude
-    ]
-
-    side_C = []
-
-    for e in candidates:
-        shares_T = shares_at_least_two_nodes(e, shells_T, nodes_all)
-        if not shares_T:
-            continue
 
-        shares_A = shares_at_least_two_nodes(e, shells_A, nodes_all)
-        shares_B = shares_at_least_two_nodes(e, shells_B, nodes_all)
-
-        if not shares_A and not shares_B:
-            side_C.append(e)
+    snap = shell_snapshot(deck)
+    found = find_side_C(
+        snap,
+        node_shell_index(deck),
+        snap.index(shells_T),
+        snap.index(shells_A),
+        snap.index(shells_B)
+    )
 
+    side_C = [e for e in snap.handles(found) if base.IsEntityVisible(e)]
 
+    registry = set_registry(deck)
     if delete_existing:
-        old = get_set_by_name(deck, name_out)
-        if old:
-            base.DeleteEntity(old)
+        registry.delete(registry.by_name.get(name_out, []))
 
-    set_C = base.CreateEntity(deck, "SET", {"Name": name_out})
+    set_C = registry.create({"Name": name_out})
     if side_C:
         base.AddToSet(set_C, side_C)
 
@@ -1149,13 +1816,7 @@ def build_T_joint_side_C(
 
 def get_elements_from_set(set_name):
     deck = constants.NASTRAN
-    sets = base.CollectEntities(deck, None, "SET")
-    target_set = None
-    for s in sets:
-        vals = base.GetEntityCardValues(deck, s, ("Name",))
-        if vals and vals.get("Name") == set_name:
-            target_set = s
-            break
+    target_set = set_registry(deck).get(set_name)
     if not target_set:
         print(f"SET '{set_name}' not found.")
         return []
@@ -1163,15 +1824,10 @@ def get_elements_from_set(set_name):
     if elems:
         base.Or(elems)
         base.Highlight("on")
-        triple_check = base.Checks.GetViolations()
-        triple_reports = triple_check.GetReport(
-            "ncs_soln:Check_ERC_NASTRAN_Triple_Joint"
-        )
-        triple_joint_elems = set()
-        for report in triple_reports:
-            for issue in report.Issues:
-                for ent in issue.Entities:
-                    triple_joint_elems.add(ent)
+        # The ERC triple-joint report covers the whole model, not just the
+        # shells base.Or left visible.
+        all_shells = np.arange(len(shell_snapshot(deck)))
+        triple_joint_elems = triple_bounds(deck, all_shells).handles()
         base.Or(triple_joint_elems)
         base.Highlight("off")
     
@@ -1186,623 +1842,415 @@ def get_elements_from_set(set_name):
         )
         return elems
     
-def t_node():
-    deck = constants.NASTRAN
-
-    def get_shell_node_ids(shell):
-        keys = ("G1", "G2", "G3", "G4", "G5", "G6", "G7", "G8")
-        vals = base.GetEntityCardValues(deck, shell, keys)
-        return [
-            vals[k] for k in keys
-            if k in vals and vals[k] and vals[k] != 0
-        ]
-
-    shells = base.CollectEntities(
-        deck,
-        None,
-        "SHELL",
-        filter_visible=True
-    ) or []
+NODE_START = 1
+NODE_END = 2
+NODE_MID = 3
 
-    shell_nodes = {}
-    node_to_shells = {}
 
-    for shell in shells:
-        nodes = get_shell_node_ids(shell)
-        shell_nodes[shell._id] = nodes
-        for n in nodes:
-            node_to_shells.setdefault(n, []).append(shell._id)
+class NodeRoles:
+    # Weld nodes as sorted GRID IDs, each with a role code. Unpacks into the
+    # start, end and middle ID arrays; GRID handles are looked up only when
+    # a set is written (grid_handles).
 
-    visited = set()
-    groups = []
+    def __init__(self, grid_ids, role):
+        keep = np.flatnonzero(role)
+        self.ids = grid_ids[keep]
+        self.roles = role[keep]
 
-    for sid in shell_nodes:
-        if sid not in visited:
-            stack = [sid]
-            group = []
+    def __len__(self):
+        return len(self.ids)
 
-            while stack:
-                current = stack.pop()
-                if current in visited:
-                    continue
+    def __iter__(self):
+        return (self.with_role(r) for r in (NODE_START, NODE_END, NODE_MID))
 
-                visited.add(current)
-                group.append(current)
+    def with_role(self, role):
+        return self.ids[self.roles == role]
 
-                for node in shell_nodes[current]:
-                    for neighbor in node_to_shells.get(node, []):
-                        if neighbor not in visited:
-                            stack.append(neighbor)
+    def handles(self, deck, role):
+        return grid_handles(deck, self.with_role(role))
 
-            groups.append(group)
-
-    base.Neighb("1")
 
-    triple_check = base.Checks.mesh.TripleBounds()
-    triple_reports = triple_check.execute(
-        exec_mode=base.Check.EXEC_ON_VS,
-        report=base.Check.REPORT_NONE
+def grid_handles(deck, grids):
+    # GRID IDs (or entities) to handles through one cached collect of every
+    # GRID, instead of a GetEntity per node.
+    ids, handles = run_cache(("grid_handles", deck), lambda: _grid_handle_index(deck))
+    gids = np.fromiter(
+        (g if isinstance(g, (int, np.integer)) else g._id for g in grids),
+        dtype=np.int64,
+        count=len(grids)
+    )
+    return [handles[p] for p in dense_lookup(ids, gids).tolist() if p >= 0]
+
+
+def _grid_handle_index(deck):
+    grids = base.CollectEntities(deck, None, "GRID") or []
+    ids = np.fromiter((g._id for g in grids), dtype=np.int64, count=len(grids))
+    order = np.argsort(ids, kind="stable")
+    return ids[order], [grids[i] for i in order.tolist()]
+
+
+def weld_group_ends(snap, elem_idx, max_nodes=None, node_map=None):
+    # Node-connected groups of elem_idx and, per group, its first two outer
+    # shells (exactly one neighbour; -1 when missing), in group order. The
+    # free nodes of an outer shell are the ones no other shell uses. With
+    # max_nodes only the first max_nodes nodes of each shell count.
+    local, nodes = shell_incidence(snap, elem_idx, node_map)
+    if max_nodes is not None:
+        starts = np.searchsorted(local, local, side="left")
+        keep = np.arange(len(local)) - starts < max_nodes
+        local, nodes = local[keep], nodes[keep]
+
+    n = len(elem_idx)
+    labels, n_comps = incidence_components(n, local, nodes)
+    comp_order, _ = component_members(labels, n_comps)
+    adj_offsets, _ = incidence_adjacency(n, local, nodes)
+
+    outer = comp_order[np.diff(adj_offsets)[comp_order] == 1]
+    ends = np.full((n_comps, 2), -1, dtype=np.int64)
+    comps, first = np.unique(labels[outer], return_index=True)
+    ends[comps, 0] = outer[first]
+    rest = np.ones(len(outer), dtype=bool)
+    rest[first] = False
+    comps, second = np.unique(labels[outer[rest]], return_index=True)
+    ends[comps, 1] = outer[rest][second]
+
+    valence = np.bincount(nodes, minlength=len(snap.grid_ids))
+    return SimpleNamespace(
+        local=local, nodes=nodes, labels=labels, ends=ends,
+        free=valence[nodes] == 1
     )
 
-    node_usage = {}
-
-    for report in triple_reports:
-        for issue in report.Issues:
-            for ent in issue.Entities:
-                vals = base.GetEntityCardValues(
-                    deck,
-                    ent,
-                    ("G1", "G2", "G3", "G4", "G5", "G6", "G7", "G8")
-                )
-                nodes_issue = [
-                    vals[k] for k in vals
-                    if vals[k] and vals[k] != 0
-                ]
-
-                for n in nodes_issue:
-                    node_usage[n] = node_usage.get(n, 0) + 1
-
-    triple_node_list = [
-        nid for nid, count in node_usage.items()
-        if count >= 3
-    ]
-
-    set1 = []
-    set2 = []
-    set3 = []
-
-    used_nodes = set()
-
-    for i, group in enumerate(groups, start=1):
-        neighbor_map = {sid: set() for sid in group}
-
-        for sid in group:
-            for node in shell_nodes[sid]:
-                for neighbor in node_to_shells.get(node, []):
-                    if neighbor in group and neighbor != sid:
-                        neighbor_map[sid].add(neighbor)
-
-        outer = [
-            sid for sid, neighbors in neighbor_map.items()
-            if len(neighbors) == 1
-        ]
-
-        if len(outer) < 2:
-            continue
-
-        first_outer, second_outer = outer[0], outer[1]
 
-    first_nodes = shell_nodes[first_outer]
-    shared_first = [
-        n for n in first_nodes
-        for nb in neighbor_map[first_outer]
-        if n in shell_nodes[nb]
-    ]
-    free_first = [
-        n for n in first_nodes
-        if n not in shared_first and n in triple_node_list
-    ]
+def t_node():
+    deck = constants.NASTRAN
+    snap = shell_snapshot(deck)
 
-    second_nodes = shell_nodes[second_outer]
-    shared_second = [
-        n for n in second_nodes
-        for nb in neighbor_map[second_outer]
-        if n in shell_nodes[nb]
-    ]
-    free_second = [
-        n for n in second_nodes
-        if n not in shared_second and n in triple_node_list
-    ]
+    vis = visible_shell_index(deck)
+    node_map = coincident_node_map(deck, vis)
+    groups = weld_group_ends(snap, vis, node_map=node_map)
 
-    if free_first:
-        node_ent = base.GetEntity(deck, "GRID", free_first[0])
-        if node_ent:
-            set1.append(node_ent)
-            used_nodes.add(free_first[0])
-
-    if free_second:
-        node_ent = base.GetEntity(deck, "GRID", free_second[0])
-        if node_ent:
-            set2.append(node_ent)
-            used_nodes.add(free_second[0])
-
-    remaining_nodes = [
-        n for n in triple_node_list
-        if n not in used_nodes
-    ]
+    base.Neighb("1")
 
-    for nid in remaining_nodes:
-        node_ent = base.GetEntity(deck, "GRID", nid)
-        if node_ent:
-            set3.append(node_ent)
+    # A merged node is triple when any of its coincident GRIDs is.
+    usage = triple_bounds(deck).node_usage >= 3
+    is_triple = np.bincount(node_map, weights=usage, minlength=len(usage)) > 0
+
+    # Start / end: the first free triple node of each group's two outer
+    # shells; every other triple node is a middle node.
+    role = np.where(is_triple, NODE_MID, 0).astype(np.int8)
+    slot_comp = groups.labels[groups.local]
+    for col, code in ((0, NODE_START), (1, NODE_END)):
+        ends = groups.ends[:, col]
+        hit = (
+            (ends[slot_comp] == groups.local)
+            & (groups.ends[slot_comp, 1] >= 0)
+            & groups.free & is_triple[groups.nodes]
+        )
+        _, first = np.unique(slot_comp[hit], return_index=True)
+        role[groups.nodes[np.flatnonzero(hit)[first]]] = code
 
-    return set1, set2, set3
+    # Coincident GRIDs share the role of the node they were merged into.
+    return NodeRoles(snap.grid_ids, role[node_map])
 
 
 def lap_node():
     deck = constants.NASTRAN
-    shells = base.CollectEntities(deck, None, "SHELL", filter_visible=True)
-    node_to_shells = {}
-    shell_nodes = {}
-
-    for shell in shells:
-        vals = base.GetEntityCardValues(deck, shell, ("G1", "G2", "G3", "G4"))
-        nodes = [vals["G1"], vals["G2"], vals["G3"], vals["G4"]]
-        shell_nodes[shell._id] = nodes
-        for n in nodes:
-            node_to_shells.setdefault(n, []).append(shell._id)
-
-    visited = set()
-    groups = []
-
-    for shell_id in shell_nodes:
-        if shell_id not in visited:
-            stack = [shell_id]
-            group = []
-
-            while stack:
-                current = stack.pop()
-                if current in visited:
-                    continue
-
-                visited.add(current)
-                group.append(current)
-
-                for node in shell_nodes[current]:
-                    for neighbor in node_to_shells.get(node, []):
-                        if neighbor not in visited:
-                            stack.append(neighbor)
-
-            groups.append(group)
-
-    set1 = []
-    set2 = []
-    set3 = []
-    excluded_nodes = set()
-    all_nodes_from_shells = set()
-
-    for i, group in enumerate(groups, start=1):
-        neighbor_map = {sid: set() for sid in group}
-
-        for sid in group:
-            for node in shell_nodes[sid]:
-                for neighbor in node_to_shells[node]:
-                    if neighbor in group and neighbor != sid:
-                        neighbor_map[sid].add(neighbor)
-
-        outer = [
-            sid for sid, neighbors in neighbor_map.items()
-            if len(neighbors) == 1
-        ]
-
-        if len(outer) < 2:
-            continue
-
-        first_outer, second_outer = outer[0], outer[1]
-
-        for sid in group:
-            all_nodes_from_shells.update(shell_nodes[sid])
-
-        first_nodes = shell_nodes[first_outer]
-        shared_first = [
-            n for n in first_nodes
-            for nb in neighbor_map[first_outer]
-            if n in shell_nodes[nb]
-        ]
-        free_first = [
-            n for n in first_nodes
-            if n not in shared_first
-        ]
-
-        second_nodes = shell_nodes[second_outer]
-        shared_second = [
-            n for n in second_nodes
-            for nb in neighbor_map[second_outer]
-            if n in shell_nodes[nb]
-        ]
-        free_second = [
-            n for n in second_nodes
-            if n not in shared_second
-        ]
-
-        for nid in free_first:
-            node_ent = base.GetEntity(deck, "GRID", nid)
-            set1.append(node_ent)
-            excluded_nodes.add(nid)
-
-        for nid in free_second:
-            node_ent = base.GetEntity(deck, "GRID", nid)
-            set2.append(node_ent)
-            excluded_nodes.add(nid)
-
-    remaining_nodes = all_nodes_from_shells - excluded_nodes
-
-    for nid in remaining_nodes:
-        node_ent = base.GetEntity(deck, "GRID", nid)
-        set3.append(node_ent)
-
-    return set1, set2, set3
+    snap = shell_snapshot(deck)
 
+    vis = visible_shell_index(deck)
+    node_map = coincident_node_map(deck, vis)
+    groups = weld_group_ends(snap, vis, max_nodes=4, node_map=node_map)
 
-def angle_between_shells(shell1, shell2):
-    n1 = base.GetNormalVectorOfShell(shell1)
-    n2 = base.GetNormalVectorOfShell(shell2)
-    dot = sum(a * b for a, b in zip(n1, n2))
+    # Groups with two outer shells: their free nodes are start / end, every
+    # other node of the group is a middle node.
+    slot_comp = groups.labels[groups.local]
+    chained = groups.ends[slot_comp, 1] >= 0
 
-    if dot > 1:
-        dot = round(dot)
-    if dot < -1:
-        dot = round(dot)
+    role = np.zeros(len(snap.grid_ids), dtype=np.int8)
+    role[groups.nodes[chained]] = NODE_MID
+    for col, code in ((0, NODE_START), (1, NODE_END)):
+        hit = chained & groups.free & (groups.ends[slot_comp, col] == groups.local)
+        role[groups.nodes[hit]] = code
 
-    mag1 = round(math.sqrt(sum(x * x for x in n1)))
-    mag2 = round(math.sqrt(sum(x * x for x in n2)))
-
-    return math.degrees(math.acos(dot / (mag1 * mag2)))
+    return NodeRoles(snap.grid_ids, role[node_map])
 
 
 def get_shell_nodes(deck, elem):
-    keys = ("G1", "G2", "G3", "G4", "G5", "G6", "G7", "G8")
-    vals = base.GetEntityCardValues(deck, elem, keys)
-    return [vals[k] for k in keys if k in vals and vals[k]]
-
-def build_adjacency_any_node(deck, elems, elem_nodes=None):
-    if elem_nodes is None:
-        elem_nodes = {}
-        for e in elems:
-            elem_nodes[e] = get_shell_nodes(deck, e)
-
-    node_to_elems = defaultdict(list)
-    for e, nodes in elem_nodes.items():
-        for n in nodes:
-            node_to_elems[n].append(e)
-
-    adj = {e: set() for e in elems}
-    for owners in node_to_elems.values():
-        if len(owners) > 1:
-            for i in range(len(owners)):
-                for j in range(i + 1, len(owners)):
-                    a, b = owners[i], owners[j]
-                    adj[a].add(b)
-                    adj[b].add(a)
-
-    return adj, elem_nodes
-
-
-def is_loop(adj, group):
-    return all(len(adj[e]) == 2 for e in group)
-
+    return shell_snapshot(deck).grids(elem)
+
+def node_adjacency(snap, elem_idx):
+    # CSR adjacency over elem_idx, neighbours sharing at least one node:
+    # element j touches adj[adj_offsets[j]:adj_offsets[j + 1]], ascending.
+    return incidence_adjacency(len(elem_idx), *shell_incidence(snap, elem_idx))
+
+
+def incidence_adjacency(n, local, nodes):
+    order = np.lexsort((local, nodes))
+    local, nodes = local[order], nodes[order]
+
+    head = np.ones(len(nodes), dtype=bool)
+    head[1:] = nodes[1:] != nodes[:-1]
+    starts = np.flatnonzero(head)
+    group = np.cumsum(head) - 1
+    size = np.diff(np.append(starts, len(nodes)))[group]
+
+    # every slot paired with every slot of the same node
+    u = np.repeat(local, size)
+    pos = np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size)
+    v = local[np.repeat(starts[group], size) + pos]
+
+    keep = u != v
+    pairs = np.unique(u[keep] * n + v[keep])
+    src, adj = np.divmod(pairs, max(n, 1))
+
+    adj_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=adj_offsets[1:])
+    return adj_offsets, adj
+
+
+def order_components(adj_offsets, adj, comp_order, comp_offsets):
+    # Traversal order of every component, O(n) over all of them. A chain is
+    # walked from its first end, a loop from its first member; a branched
+    # group is laid out along its tree diameter (two BFS) with every other
+    # element linked in right after its BFS parent, so spurs follow the
+    # element they hang off. Component c is order[offsets[c]:offsets[c + 1]].
+    offsets = adj_offsets.tolist()
+    nbrs = adj.tolist()
+    degree = np.diff(adj_offsets)
+    order = np.empty(len(comp_order), dtype=np.int64)
+    pred = {}
 
-def find_endpoints(adj, group):
-    return [e for e in group if len(adj[e]) == 1]
-
-
-def order_chain_from_endpoint(adj, start):
-    order = []
-    visited = set()
-    cur = start
-    prev = None
-
-    while cur is not None:
-        order.append(cur)
-        visited.add(cur)
-        next_candidates = [
-            n for n in adj[cur]
-            if n != prev and n not in visited
-        ]
-
-        if not next_candidates:
-            next_candidates = [
-                n for n in adj[cur]
-                if n not in visited
-            ]
-
-        prev, cur = cur, (
-            next_candidates[0] if next_candidates else None
-        )
-
-    return order
-
-
-def order_loop(adj, group):
-    start = group[0]
-    order = [start]
-    visited = {start}
-    prev = None
-    cur = start
-
-    while True:
-        next_candidates = [n for n in adj[cur] if n != prev]
-        next_unvisited = [
-            n for n in next_candidates
-            if n not in visited
-        ]
+    def bfs(src):
+        pred.clear()
+        pred[src] = -1
+        seen = [src]
+        for u in seen:
+            for v in nbrs[offsets[u]:offsets[u + 1]]:
+                if v not in pred:
+                    pred[v] = u
+                    seen.append(v)
+        return seen
+
+    for c in range(len(comp_offsets) - 1):
+        a, b = comp_offsets[c], comp_offsets[c + 1]
+        members = comp_order[a:b]
+        deg = degree[members]
+
+        if deg.max() <= 2:
+            ends = members[deg == 1]
+            cur = int(ends[0] if len(ends) else members[0])
+            prev = -1
+            for k in range(a, b):
+                order[k] = cur
+                step = [v for v in nbrs[offsets[cur]:offsets[cur + 1]] if v != prev]
+                prev, cur = cur, (step[0] if step else -1)
+            continue
 
-        nxt = (
-            next_unvisited[0]
-            if next_unvisited
-            else (
-                next_candidates[0]
-                if next_candidates else None
-            )
-        )
+        far = bfs(int(members[0]))[-1]
+        seen = bfs(far)
 
-        if nxt is None or nxt == start:
-            break
+        node = seen[-1]
+        on_path = {node}
+        after = {}
+        while pred[node] >= 0:
+            after[pred[node]] = node
+            node = pred[node]
+            on_path.add(node)
 
-        order.append(nxt)
-        visited.add(nxt)
-        prev, cur = cur, nxt
+        for e in seen:
+            if e in on_path:
+                continue
+            parent = pred[e]
+            if parent in after:
+                after[e] = after[parent]
+            after[parent] = e
 
-        if len(order) == len(group):
-            break
+        node = far
+        for k in range(a, b):
+            order[k] = node
+            node = after.get(node, -1)
 
-    if len(order) < len(group):
-        remaining = set(group) - set(order)
-        for r in list(remaining):
-            nbrs = adj[r]
-            pos = None
-            for i, e in enumerate(order):
-                if e in nbrs:
-                    pos = i + 1
-                    break
-            if pos is None:
-                order.append(r)
-            else:
-                order.insert(pos, r)
+    return order, comp_offsets.copy()
 
-    return order
 
-def longest_path_order(adj, group):
-    def bfs(src):
-        pred = {src: None}
-        q = deque([src])
+def ordered_shell_groups(deck, elems):
+    # Connected groups of elems (shared nodes), each in traversal order, as
+    # flat local indices: group c is order[offsets[c]:offsets[c + 1]].
+    snap = shell_snapshot(deck)
+    elem_idx = snap.index(elems)
+    labels, n_comps = label_components(snap, elem_idx)
+    comp_order, comp_offsets = component_members(labels, n_comps)
+    adj_offsets, adj = node_adjacency(snap, elem_idx)
+    return order_components(adj_offsets, adj, comp_order, comp_offsets)
 
-        while q:
-            u = q.popleft()
-            for v in adj[u]:
-                if v not in pred:
-                    pred[v] = u
-                    q.append(v)
-
-        far = u
-        return pred, far
-
-    start = group[0]
-    pred1, A = bfs(start)
-    pred2, B = bfs(A)
-
-    path = []
-    cur = B
-    while cur is not None:
-        path.append(cur)
-        cur = pred2[cur]
-
-    path = list(reversed(path))
-    ordered = list(path)
-    in_order = set(ordered)
-
-    remaining = deque([e for e in group if e not in in_order])
-    while remaining:
-        e = remaining.popleft()
-        attachment_points = [
-            i for i, x in enumerate(ordered)
-            if x in adj[e]
-        ]
 
-        if attachment_points:
-            ordered.insert(attachment_points[0] + 1, e)
-            in_order.add(e)
-        else:
-            remaining.append(e)
-            if all(x in in_order for x in group):
-                break
+def group_connected_shells(deck, elems):
+    solid_elems = elems
+    if not solid_elems:
+        return []
 
-        if len(remaining) == 1 and remaining[0] == e:
-            ordered.append(e)
-            in_order.add(e)
-            remaining.clear()
+    order, offsets = ordered_shell_groups(deck, solid_elems)
+    stage_note(elements=len(solid_elems), components=len(offsets) - 1)
 
-    return ordered
+    return [
+        [solid_elems[j] for j in order[offsets[c]:offsets[c + 1]].tolist()]
+        for c in range(len(offsets) - 1)
+    ]
 
 
-def order_group(adj, group):
-    degs = {e: len(adj[e]) for e in group}
-    endpoints = [e for e, d in degs.items() if d == 1]
+ANGLE_TOL = 5.0
+# |cos| above COS_PARALLEL is within ANGLE_TOL of 0 or 180 degrees, below
+# COS_PERPENDICULAR within ANGLE_TOL of 90 degrees.
+COS_PARALLEL = math.cos(math.radians(ANGLE_TOL))
+COS_PERPENDICULAR = math.sin(math.radians(ANGLE_TOL))
 
-    if endpoints:
-        return order_chain_from_endpoint(adj, endpoints[0])
-    elif is_loop(adj, group):
-        return order_loop(adj, group)
-    else:
-        return longest_path_order(adj, group)
-    
-def group_connected_shells(deck, elems):
-    solid_elems = elems
-    if not solid_elems:
-        return []
 
-    adj, elem_nodes = build_adjacency(deck, solid_elems)
-    visited = set()
-    components = []
+def classify_angle_triplets(normals_main, normals_1, normals_2):
+    # One row per group: the middle weld shell and its two short neighbours.
+    # Returns the rows that are side joints, T centers, and the two kinds of
+    # critical rows (short shells not parallel / out of every tolerance).
+    cos_short = np.abs(v_dot(normals_1, normals_2))
+    cos_main = np.abs(v_dot(normals_main, normals_1))
+    cos_sec = np.abs(v_dot(normals_main, normals_2))
 
-    for e in solid_elems:
-        if e in visited:
-            continue
-        q = deque([e])
-        comp = []
-        visited.add(e)
+    par_short = cos_short > COS_PARALLEL
+    par_main = cos_main > COS_PARALLEL
+    par_sec = cos_sec > COS_PARALLEL
+    perp = (cos_main < COS_PERPENDICULAR) | (cos_sec < COS_PERPENDICULAR)
 
-        while q:
-            u = q.popleft()
-            comp.append(u)
-            for v in adj[u]:
-                if v not in visited:
-                    visited.add(v)
-                    q.append(v)
+    side = par_short & par_main
+    center = par_short & ~par_main & (par_sec | perp)
+    crossed = par_short & ~side & ~center
 
-        components.append(comp)
+    return (
+        np.flatnonzero(side),
+        np.flatnonzero(center),
+        np.flatnonzero(~par_short),
+        np.flatnonzero(crossed),
+    )
 
-    ordered_groups = []
-    for comp in components:
-        sub_adj = {e: adj[e].intersection(comp) for e in comp}
-        ordered = order_group(sub_adj, comp)
-        ordered_groups.append(ordered)
 
-    return ordered_groups
+def report_critical(critical_groups, idx, elems, reason):
+    print(reason)
+    critical_groups[idx] = elems
+    print(f"Critical weld group {idx} ({[e._id for e in elems]})")
 
 
 def classify_groups(deck, solid_elems, triple_joint_elems, group):
-    side_joint_set = base.CreateEntity(deck, "SET", {"Name": "T_Joint_side"})
-    t_joint_set = base.CreateEntity(deck, "SET", {"Name": "T_Joint_center"})
-    critical_groups = []
+    snap = shell_snapshot(deck)
+    registry = set_registry(deck)
+    side_joint_set = registry.create({"Name": "T_Joint_side"})
+    t_joint_set = registry.create({"Name": "T_Joint_center"})
+    critical_groups = {}
+
+    # The visible model (weld shells plus their 1-ring) does not change
+    # while groups are examined, so its incidence is built once. The masks
+    # carry a spare last slot so IDs outside the snapshot (-1) land there.
+    vis_elems = base.CollectEntities(deck, None, "SHELL", filter_visible=True) or []
+    vis_idx = snap.index(vis_elems)
+    visible = NodeShellIndex(snap, vis_idx[vis_idx >= 0])
+
+    is_solid = np.zeros(len(snap) + 1, dtype=bool)
+    is_solid[snap.index(solid_elems)] = True
+    is_triple = np.zeros(len(snap) + 1, dtype=bool)
+    is_triple[snap.index(list(triple_joint_elems))] = True
+
+    # (group number, group, middle shell, short shell 1, short shell 2)
+    triplets = []
 
     for idx, elems in enumerate(group, start=1):
         if len(elems) < 3:
             continue
 
         mid_index = len(elems) // 2
-        second_elem = elems[mid_index]
-        conn = base.GetEntityCardValues(
-            deck,
-            second_elem,
-            ("G1", "G2", "G3", "G4")
-        )
-        nodes = [conn["G1"], conn["G2"], conn["G3"], conn["G4"]]
-        node_entities = [
-            base.GetEntity(deck, "GRID", n)
-            for n in nodes if n
-        ]
+        second_elem = snap.index([elems[mid_index]])[0]
+        nodes = snap.node_slice(second_elem)[:4]
+        valence = visible.valence[nodes]
 
-        shell_refs = [
-            e for e in base.AdvancedEntityRelations(deck)
-            if e.get("ENTITY") == "SHELL"
-            for node in node_entities
-        ]
-
-        vis_elems = base.CollectEntities(
-            deck, None, "SHELL", filter_visible=True
-        )
+        four_nodes = nodes[valence == 4]
+        six_nodes = nodes[valence == 6]
 
-        node_to_shells = {}
-        for shell in vis_elems:
-            conn = base.GetEntityCardValues(
-                deck,
-                shell,
-                ("G1", "G2", "G3", "G4")
-            )
-            for key, nid in conn.items():
-                if nid and nid in nodes:
-                    node_to_shells.setdefault(nid, []).append(shell)
-
-        node_refs = []
-        for node_id in nodes:
-            refs = node_to_shells.get(node_id, [])
-            node_refs.append(refs)
-
-        four_nodes = [i for i, refs in enumerate(node_refs) if len(refs) == 4]
-        six_nodes = [i for i, refs in enumerate(node_refs) if len(refs) == 6]
-
-        if len(four_nodes) == 2 and len(six_nodes) == 2:
-            common_first_two = set(node_refs[four_nodes[0]]) & set(node_refs[four_nodes[1]])
-            common_first_two = [
-                e for e in common_first_two
-                if e not in solid_elems and e not in triple_joint_elems
-            ]
-
-            short_elem_1 = common_first_two[0] if common_first_two else None
-
-            common_last_two = set(node_refs[six_nodes[0]]) & set(node_refs[six_nodes[1]])
-            common_last_two = [
-                e for e in common_last_two
-                if e in triple_joint_elems and e not in solid_elems
-            ]
-
-            short_elem_2 = common_last_two[0] if len(common_last_two) == 1 else None
-
-            if short_elem_1 and short_elem_2:
-                angle_short = angle_between_shells(short_elem_1, short_elem_2)
-                angle_main = angle_between_shells(second_elem, short_elem_1)
-                angle_sec = angle_between_shells(second_elem, short_elem_2)
-
-                if abs(angle_short) < 5 or abs(angle_short - 180) < 5:
-                    if abs(angle_main) < 5 or abs(angle_main - 180) < 5:
-                        base.AddToSet(side_joint_set, elems)
-                    elif abs(angle_sec) < 5 or abs(angle_sec - 180) < 5:
-                        base.AddToSet(t_joint_set, elems)
-                    elif abs(angle_main - 90) < 5 or abs(angle_sec - 90) < 5:
-                        base.AddToSet(t_joint_set, elems)
-                    else:
-                        print(
-                            "In below group : more and lower elements are neither parallel nor perpendicular "
-                            "and is crossed angle tolerance limit"
-                        )
-                        critical_groups[idx] = elems
-                        print(
-                            "Critical weld group {} ({}-id for e in elems)".format(idx)
-                        )
-                else:
-                    print(
-                        "In below group : more two elements is not parallel and angle between them is more than 5 degree"
-                    )
-                    critical_groups[idx] = elems
-                    print(
-                        "Critical weld group {} ({}-id for e in elems)".format(idx)
-                    )
-            else:
-                print("In below group : elements are perpendicular combinations")
-                critical_groups[idx] = elems
-                print(
-                    "Critical weld group {} ({}-id for e in elems)".format(idx)
-                )
-        else:
-            print("In below group : there are nonstandard combinations")
-            critical_groups[idx] = elems
-            print(
-                "Critical weld group {} ({}-id for e in elems)".format(idx)
-            )
+        if len(four_nodes) != 2 or len(six_nodes) != 2:
+            report_critical(critical_groups, idx, elems, "In below group : there are nonstandard combinations")
+            continue
 
-        tjb_elems = base.CollectEntities(deck, t_joint_set, "SHELL", recursive=True)
-        base.Or(tjb_elems)
-        start_l,end_l,middel_l=lap_node()
+        common_first_two = np.intersect1d(
+            visible.shells_of(four_nodes[0]),
+            visible.shells_of(four_nodes[1])
+        )
+        common_first_two = common_first_two[
+            ~is_solid[common_first_two] & ~is_triple[common_first_two]
+        ]
 
-        tjs_elems = base.CollectEntities(deck, side_joint_set, "SHELL", recursive=True)
-        base.Or(tjs_elems)
-        start_l,end_l,middel_l=t_node()
+        common_last_two = np.intersect1d(
+            visible.shells_of(six_nodes[0]),
+            visible.shells_of(six_nodes[1])
+        )
+        common_last_two = common_last_two[
+            is_triple[common_last_two] & ~is_solid[common_last_two]
+        ]
 
-        start2_start_3()
-        extend_joint_s()
-        solid_model_validate_t()
+        if not len(common_first_two) or len(common_last_two) != 1:
+            report_critical(critical_groups, idx, elems, "In below group : elements are perpendicular combinations")
+            continue
 
-        set1 = base.CreateEntity(deck, "SET", {"Name": "Core_side", "ID": 301})
-        base.AddToSet(set1, start_s)
+        triplets.append((idx, elems, second_elem, common_first_two[0], common_last_two[0]))
 
-        set2 = base.CreateEntity(deck, "SET", {"Name": "Core_end", "ID": 302})
-        base.AddToSet(set2, end_s)
+    if triplets:
+        rows = np.array([t[2:] for t in triplets], dtype=np.int64)
+        normals = shell_geometry(deck).normals(rows.ravel()).reshape(-1, 3, 3)
+        side, center, not_parallel, crossed = classify_angle_triplets(
+            normals[:, 0],
+            normals[:, 1],
+            normals[:, 2]
+        )
 
-        set3 = base.CreateEntity(deck, "SET", {"Name": "Core_mid", "ID": 303})
-        base.AddToSet(set3, mid_s)
+        writer = SetWriter(deck)
+        for r in side.tolist():
+            writer.add(side_joint_set, triplets[r][1])
+        for r in center.tolist():
+            writer.add(t_joint_set, triplets[r][1])
+        report_set_counts(writer.flush())
 
-        return critical_groups
+        reasons = dict.fromkeys(
+            not_parallel.tolist(),
+            "In below group : more two elements is not parallel and angle between them is more than 5 degree"
+        )
+        reasons.update(dict.fromkeys(
+            crossed.tolist(),
+            "In below group : more and lower elements are neither parallel nor perpendicular "
+            "and is crossed angle tolerance limit"
+        ))
+        for r in sorted(reasons):
+            idx, elems = triplets[r][:2]
+            report_critical(critical_groups, idx, elems, reasons[r])
+
+    tjb_elems = base.CollectEntities(deck, t_joint_set, "SHELL", recursive=True)
+    base.Or(tjb_elems)
+    lap_roles = lap_node()
+
+    tjs_elems = base.CollectEntities(deck, side_joint_set, "SHELL", recursive=True)
+    base.Or(tjs_elems)
+    t_roles = t_node()
+
+    start2_start_3()
+    extend_joint_s()
+    solid_model_validate_t()
+
+    # Core sets take the lap and T nodes of each role; GRID handles are
+    # looked up here, as each set is written.
+    writer = SetWriter(deck)
+    for role, name, sid in (
+        (NODE_START, "Core_side", 301),
+        (NODE_END, "Core_end", 302),
+        (NODE_MID, "Core_mid", 303),
+    ):
+        core_set = registry.create({"Name": name, "ID": sid})
+        writer.add(core_set, lap_roles.handles(deck, role))
+        writer.add(core_set, t_roles.handles(deck, role))
+    writer.flush()
+
+    return dict(sorted(critical_groups.items()))
 
 def create_set_for_material(deck, material_name, new_set_name):
     material_id = None
@@ -1821,69 +2269,330 @@ def create_set_for_material(deck, material_name, new_set_name):
         print(f"No shell elements found for material '{material_name}'.")
         return None
 
-    new_set = base.CreateEntity(deck, "SET", {"Name": new_set_name})
+    new_set = set_registry(deck).create({"Name": new_set_name})
     base.AddToSet(new_set, elems)
     return new_set
 
 
-def main():
-    deck = constants.NASTRAN
-    material_name = "SHELL_MAT"
-    set_name = "weld_elements"
+# Offline decks: everything the classifier reads (shell connectivity, grid
+# coordinates, SET and material membership, visibility) exported once as
+# raw .npy arrays plus manifest.json, and opened again memory-mapped.
+
+SNAPSHOT_FORMAT = "weld-deck-snapshot"
+SNAPSHOT_VERSION = 1
+
+
+def coords_for(grid_ids, gids, xyz):
+    # Rows of xyz (one per gids entry) rearranged to follow grid_ids; GRIDs
+    # without a row are NaN.
+    order = np.argsort(gids, kind="stable")
+    pos = dense_lookup(gids[order], grid_ids)
+    out = np.full((len(grid_ids), 3), np.nan)
+    found = pos >= 0
+    out[found] = xyz[order][pos[found]]
+    return out
+
+
+def membership_csr(groups):
+    # Sorted unique dense shell indices per group, flattened.
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(g) for g in groups], out=offsets[1:])
+    members = np.concatenate(groups) if groups else np.zeros(0, dtype=np.int64)
+    return offsets, members.astype(np.int64)
+
+
+def snapshot_arrays(snap, xyz, visible, sets, materials):
+    # sets: [({"Name", "SID"}, members)], materials: [({"Name", "MID"},
+    # members)], members being dense shell indices into snap.
+    set_offsets, set_members = membership_csr([m for _, m in sets])
+    mat_offsets, mat_members = membership_csr([m for _, m in materials])
+
+    return {
+        "elem_ids": snap.elem_ids,
+        "offsets": snap.offsets,
+        "nodes": snap.nodes,
+        "grid_ids": snap.grid_ids,
+        "xyz": xyz,
+        "visible": visible,
+        "set_offsets": set_offsets,
+        "set_members": set_members,
+        "mat_offsets": mat_offsets,
+        "mat_members": mat_members,
+    }
 
-    create_set_for_material(deck, material_name, set_name)
 
-    sets = base.CollectEntities(deck, None, "SET")
+def write_deck_snapshot(path, snap, xyz, visible, sets, materials):
+    arrays = snapshot_arrays(snap, xyz, visible, sets, materials)
 
-    target_set = None
-    for s in sets:
-        vals = base.GetEntityCardValues(deck, s, ("Name",))
-        if vals.get("Name") == set_name:
-            target_set = s
-            break
+    os.makedirs(path, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(arr))
 
-    if not target_set:
-        print(f"SET '{set_name}' not found.")
-        return
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "arrays": {
+            name: {"file": name + ".npy", "dtype": arr.dtype.str, "shape": list(arr.shape)}
+            for name, arr in arrays.items()
+        },
+        "sets": [card for card, _ in sets],
+        "materials": [card for card, _ in materials],
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as fh:
+        json.dump(manifest, fh, indent=1)
 
-    weld_elems = base.CollectEntities(deck, target_set, "SHELL", recursive=True)
-    base.Or(weld_elems)
+    return manifest
 
-    groups = group_connected_shells(deck, weld_elems)
-    print(f"Total weld groups are {len(groups)}")
 
-    base.Neighb("1")
+def export_deck_snapshot(deck, path):
+    snap = shell_snapshot(deck)
+    coords = grid_coordinates(deck)
+    coords.load(np.arange(len(snap.grid_ids)))
 
-    triple_check = base.Checks.mesh.TripleBounds()
-    triple_reports = triple_check.execute(
-        exec_mode=base.Check.EXEC_ON_V15,
-        report=base.Check.REPORT_NONE
-    )
+    def shell_members(container):
+        idx = snap.index(base.CollectEntities(deck, container, "SHELL", recursive=True) or [])
+        return np.unique(idx[idx >= 0])
+
+    sets = [
+        ({"Name": name, "SID": sid}, shell_members(s))
+        for s, (name, sid) in set_registry(deck).cards.items()
+    ]
+    materials = [
+        (
+            {"Name": (base.GetEntityCardValues(deck, m, ("Name",)) or {}).get("Name"), "MID": m._id},
+            shell_members(m)
+        )
+        for m in base.CollectEntities(deck, None, "MATERIAL") or []
+    ]
+
+    visible = np.zeros(len(snap), dtype=bool)
+    vis_idx = snap.index(base.CollectEntities(deck, None, "SHELL", filter_visible=True) or [])
+    visible[vis_idx[vis_idx >= 0]] = True
+
+    return write_deck_snapshot(path, snap, coords.xyz, visible, sets, materials)
+
+
+class ApiRecorder:
+    # Wraps a base module (ansa.base or a SnapshotDeck) and records, per API
+    # function and per calling function, the number of calls and the time
+    # spent in them. Nested namespaces (Checks.mesh...) are wrapped as well.
+
+    def __init__(self, target, prefix="", stats=None):
+        self._target = target
+        self._prefix = prefix
+        self._stats = stats if stats is not None else defaultdict(lambda: [0, 0.0])
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        api = self._prefix + name
+
+        if isinstance(attr, (type, int, float, str, bool, type(None))):
+            return attr
+        if not callable(attr):
+            return ApiRecorder(attr, api + ".", self._stats)
+
+        stats = self._stats
+
+        def call(*args, **kwargs):
+            code = sys._getframe(1).f_code
+            caller = getattr(code, "co_qualname", code.co_name)
+            t0 = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                entry = stats[(api, caller)]
+                entry[0] += 1
+                entry[1] += time.perf_counter() - t0
+
+        return call
+
+    def by_api(self):
+        out = defaultdict(lambda: [0, 0.0])
+        for (api, _), (calls, seconds) in self._stats.items():
+            out[api][0] += calls
+            out[api][1] += seconds
+        return {api: tuple(v) for api, v in sorted(out.items())}
+
+    def by_caller(self):
+        return {key: tuple(v) for key, v in sorted(self._stats.items())}
+
+    def reset(self):
+        self._stats.clear()
+
+
+def record_api_calls():
+    # Routes every base call through an ApiRecorder and returns it.
+    global base
+    if not isinstance(base, ApiRecorder):
+        base = ApiRecorder(base)
+    return base
+
+
+class RunReport:
+    # Stage spans of one run: wall and CPU seconds, the base API calls
+    # issued, run cache hits/misses, and whatever counts the stage notes.
+    # Costs two clock reads and two small dict diffs per span.
+
+    def __init__(self, recorder=None):
+        self.recorder = recorder
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.wall0 = time.perf_counter()
+        self.cpu0 = time.process_time()
+        self.stages = []
+        self.open = []
+
+    def _api(self):
+        if self.recorder is None:
+            return {}
+        return {api: calls for api, (calls, _) in self.recorder.by_api().items()}
+
+    @staticmethod
+    def _cache():
+        return {kind: tuple(v) for kind, v in _CACHE_STATS.items()}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        span = {"name": name, "depth": len(self.open)}
+        api0 = self._api()
+        cache0 = self._cache()
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        self.open.append(span)
+        try:
+            yield span
+        finally:
+            self.open.pop()
+            span["wall_s"] = time.perf_counter() - wall0
+            span["cpu_s"] = time.process_time() - cpu0
+
+            api = {
+                k: n - api0.get(k, 0) for k, n in self._api().items()
+                if n != api0.get(k, 0)
+            }
+            span["api_calls"] = api
+            span["api_total"] = sum(api.values())
+
+            cache = {}
+            for kind, (hits, misses) in self._cache().items():
+                h0, m0 = cache0.get(kind, (0, 0))
+                if hits != h0 or misses != m0:
+                    cache[kind] = {"hits": hits - h0, "misses": misses - m0}
+            lookups = sum(c["hits"] + c["misses"] for c in cache.values())
+            span["cache"] = cache
+            span["cache_hit_rate"] = (
+                sum(c["hits"] for c in cache.values()) / lookups if lookups else None
+            )
+            self.stages.append(span)
+
+    def note(self, **counts):
+        if self.open:
+            self.open[-1].update(counts)
+
+    def as_dict(self):
+        return {
+            "started": self.started,
+            "wall_s": time.perf_counter() - self.wall0,
+            "cpu_s": time.process_time() - self.cpu0,
+            "stages": self.stages,
+        }
+
+    def write(self, path):
+        with open(path, "w") as fh:
+            json.dump(self.as_dict(), fh, indent=1, default=str)
 
-    triple_bound_elems = set()
-    for report in triple_reports:
-        for issue in report.issues:
-            for ent in issue.entities:
-                triple_bound_elems.add(ent)
-
-    critical = classify_groups(deck, weld_elems, triple_bound_elems, groups)
-    if critical:
-        print("Critical Groups:")
-        for gid, elems in critical.items():
-            print(f"Group {gid} ({[e._id for e in elems]})")
-    else:
-        print("No Critical Groups are Present")
 
-    elements_L = get_elements_from_set("Lap_joint_deck")  #### Require set
-    elements_T = get_elements_from_set("T_joint_deck")    #### Require set
+RUN_REPORT_PATH = "weld_run_report.json"
 
-    base.All()
-    if elements_T:
-        run_assignment(deck)
+_ACTIVE_REPORT = None
 
-    base.All()
-    if elements_L:
-        run_lap_assignment(deck)
+
+def start_run_report():
+    global _ACTIVE_REPORT
+    _ACTIVE_REPORT = RunReport(record_api_calls())
+    return _ACTIVE_REPORT
+
+
+def run_stage(name):
+    # Stage span on the active report, or a no-op outside a reported run.
+    if _ACTIVE_REPORT is None:
+        return contextlib.nullcontext({})
+    return _ACTIVE_REPORT.stage(name)
+
+
+def stage_note(**counts):
+    if _ACTIVE_REPORT is not None:
+        _ACTIVE_REPORT.note(**counts)
+
+
+def print_api_calls(recorder):
+    print(f"{'API':<56}{'calls':>10}{'seconds':>12}")
+    for api, (calls, seconds) in recorder.by_api().items():
+        print(f"{api:<56}{calls:>10}{seconds:>12.4f}")
+    for (api, caller), (calls, seconds) in recorder.by_caller().items():
+        print(f"  {api + ' <- ' + caller:<54}{calls:>10}{seconds:>12.4f}")
+
+
+def main():
+    deck = constants.NASTRAN
+    reset_run_cache()
+    report = start_run_report()
+    material_name = "SHELL_MAT"
+    set_name = "weld_elements"
+
+    try:
+        with run_stage("create_set_for_material"):
+            create_set_for_material(deck, material_name, set_name)
+
+            target_set = set_registry(deck).get(set_name)
+            if not target_set:
+                print(f"SET '{set_name}' not found.")
+                return
+
+        with run_stage("group_connected_shells"):
+            weld_elems = base.CollectEntities(deck, target_set, "SHELL", recursive=True)
+            base.Or(weld_elems)
+
+            groups = group_connected_shells(deck, weld_elems)
+            print(f"Total weld groups are {len(groups)}")
+
+        with run_stage("triple_bounds") as span:
+            base.Neighb("1")
+
+            triple = triple_bounds(deck)
+            triple_bound_elems = triple.handles()
+            span["elements"] = len(triple_bound_elems)
+            span["edges"] = len(triple)
+
+        with run_stage("classify_groups") as span:
+            critical = classify_groups(deck, weld_elems, triple_bound_elems, groups)
+            span["components"] = len(groups)
+            span["critical"] = len(critical or {})
+            if critical:
+                print("Critical Groups:")
+                for gid, elems in critical.items():
+                    print(f"Group {gid} ({[e._id for e in elems]})")
+            else:
+                print("No Critical Groups are Present")
+
+        with run_stage("get_elements_from_set:Lap_joint_deck") as span:
+            elements_L = get_elements_from_set("Lap_joint_deck")  #### Require set
+            span["elements"] = len(elements_L or [])
+        with run_stage("get_elements_from_set:T_joint_deck") as span:
+            elements_T = get_elements_from_set("T_joint_deck")    #### Require set
+            span["elements"] = len(elements_T or [])
+
+        with run_stage("run_assignment"):
+            base.All()
+            if elements_T:
+                run_assignment(deck)
+
+        with run_stage("run_lap_assignment"):
+            base.All()
+            if elements_L:
+                state_path = classification_state_path(deck) if INCREMENTAL else None
+                run_lap_assignment(deck, state_path=state_path)
+    finally:
+        report.write(RUN_REPORT_PATH)
 
 
 if __name__ == "__main__":
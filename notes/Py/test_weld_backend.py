@@ -0,0 +1,316 @@
+import numpy as np
+import pytest
+
+from weld_backend import (
+    BulkReader,
+    card_fields,
+    install_backend,
+    memory_deck,
+    open_deck_snapshot,
+    read_nastran_bulk,
+    script,
+)
+from weld_bench import weld_mesh
+
+
+def set_ids(deck, name):
+    found = script.set_registry(deck).get(name)
+    return sorted(e._id for e in deck.CollectEntities(deck, found, "SHELL"))
+
+
+def lap_unit(s):
+    # T, C, A, B around center node 1 plus a second A shell; s flips the
+    # out-of-plane side of C, A and B.
+    grids = {
+        1: (0, 0, 0), 2: (1, 0, 0), 3: (1, 1, 0), 4: (0, 1, 0),
+        5: (2, 0, 0), 6: (2, -1, 0.5 * s), 7: (1, -1, 0),
+        8: (-1, 0, 0), 9: (-1, 1, s), 10: (0, 1, s),
+        11: (0, -1, 0), 12: (-1, -1, 0), 13: (-1, -0.5, -s),
+        14: (-2, 0, 0), 15: (-2, 1, s),
+    }
+    shells = {
+        1: [1, 2, 3, 4],
+        2: [2, 5, 6, 7],
+        3: [1, 8, 9, 10] if s > 0 else [1, 10, 9, 8],
+        4: [1, 11, 12, 13],
+        5: [8, 14, 15, 9],
+    }
+    sets = {
+        script.SET_T: [1],
+        script.SET_C: [2],
+        script.SET_A: [3, 5],
+        script.SET_B: [4],
+    }
+    return memory_deck(shells, grids, sets)
+
+
+@pytest.mark.parametrize("s, expected", [
+    (1, {"M452": [4], "M453": [2, 3, 5]}),
+    (-1, {"M450": [2], "M451": [4], "M454": [3, 5]}),
+])
+def test_lap_assignment(s, expected):
+    deck = install_backend(lap_unit(s))
+    script.run_lap_assignment(deck)
+
+    for name in script.OUT_SETS:
+        assert set_ids(deck, name) == expected.get(name, [])
+
+
+def ladder(rows, n, split=None):
+    # rows x n quads: shell i * n + j + 1 sits in row i, column j. With
+    # split the columns from split on get their own copies (GID + 1000) of
+    # the seam nodes, as an unmerged mesh would have them.
+    gid = lambda i, j: i * (n + 1) + j + 1
+    grids = {gid(i, j): (j, i, 0) for i in range(rows + 1) for j in range(n + 1)}
+    shells = {}
+    for i in range(rows):
+        for j in range(n):
+            nodes = [gid(i, j), gid(i, j + 1), gid(i + 1, j + 1), gid(i + 1, j)]
+            if split is not None and j >= split:
+                nodes = [g + 1000 if (g - 1) % (n + 1) == split else g for g in nodes]
+            shells[i * n + j + 1] = nodes
+    for g in [g for nodes in shells.values() for g in nodes if g > 1000]:
+        grids[g] = grids[g - 1000]
+    return shells, grids
+
+
+@pytest.mark.parametrize("n, split", [(3, None), (8, None), (8, 4)])
+def test_double_chain_sides(n, split):
+    shells, grids = ladder(2, n, split)
+    deck = install_backend(memory_deck(shells, grids, {"weld_elements": list(shells)}))
+
+    side_a, side_b = script.create_global_sets_for_double_chains(deck, "weld_elements")
+    rows = {tuple(range(1, n + 1)), tuple(range(n + 1, 2 * n + 1))}
+    a = tuple(sorted(e._id for e in deck.CollectEntities(deck, side_a, "SHELL")))
+    b = tuple(sorted(e._id for e in deck.CollectEntities(deck, side_b, "SHELL")))
+    assert {a, b} == rows
+
+
+@pytest.mark.parametrize("tol, groups", [(0.01, 1), (0, 2)])
+def test_lap_node_merges_split_seam(monkeypatch, tol, groups):
+    monkeypatch.setattr(script, "MERGE_TOL", tol)
+    shells, grids = ladder(1, 8, split=4)
+    install_backend(memory_deck(shells, grids))
+
+    start, end, mid = script.lap_node()
+    assert len(start) == len(end) == 2 * groups
+    if tol:
+        assert {5, 1005, 14, 1014} <= set(mid.tolist())
+
+
+@pytest.mark.parametrize("tol", [0.01, 0])
+def test_weld_node_map(monkeypatch, tol):
+    # Seam copies (GID + 1000) map onto the original seam nodes only when
+    # the merge tolerance is on; every other node maps to itself.
+    monkeypatch.setattr(script, "MERGE_TOL", tol)
+    shells, grids = ladder(1, 8, split=4)
+    deck = install_backend(memory_deck(shells, grids))
+    snap = script.shell_snapshot(deck)
+
+    node_map = script.weld_node_map(deck, deck.CollectEntities(deck, None, "SHELL"))
+    seam, copies = snap.grid_index([5, 14]), snap.grid_index([1005, 1014])
+    assert (node_map[copies] == (seam if tol else copies)).all()
+    others = np.setdiff1d(np.arange(len(snap.grid_ids)), copies)
+    assert (node_map[others] == others).all()
+
+    edges = script.EdgeIndex(snap, np.arange(len(snap)), node_map)
+    assert len(edges) == (25 if tol else 26)
+
+
+def out_set_ids(deck):
+    return {name: set_ids(deck, name) for name in script.OUT_SETS}
+
+
+@pytest.mark.parametrize("stage", ["run_lap_assignment", "run_assignment"])
+def test_parallel_matches_serial(monkeypatch, stage):
+    # Small stream blocks so the pool goes through several of them.
+    monkeypatch.setattr(script, "STREAM_BLOCK", 3)
+    builder = weld_mesh(600, seed=2)
+    results = []
+    for workers in (0, 2):
+        deck = install_backend(builder.deck())
+        getattr(script, stage)(deck, workers=workers)
+        results.append(out_set_ids(deck))
+    assert results[0] == results[1]
+    assert any(results[0].values())
+
+
+def test_incremental_reuse(tmp_path, capsys):
+    state = str(tmp_path / "state.json")
+    deck = install_backend(weld_mesh(300, seed=4, kinds={"lap": 3, "chain": 1}).deck())
+    script.run_lap_assignment(deck, state_path=state)
+    first = out_set_ids(deck)
+    capsys.readouterr()
+
+    # An unchanged deck reuses every group and leaves the sets as they are.
+    script.run_lap_assignment(deck, state_path=state)
+    assert "classifying 0" in capsys.readouterr().out
+    assert out_set_ids(deck) == first
+
+    # A shell that does not belong in an output set is patched out of it.
+    stray = deck.CollectEntities(deck, script.set_registry(deck).get("weld_elements"), "SHELL")[0]
+    target = script.set_registry(deck).get("M452")
+    deck.AddToSet(target, [stray])
+    assert stray._id in set_ids(deck, "M452")
+    script.run_lap_assignment(deck, state_path=state)
+    assert out_set_ids(deck) == first
+
+
+def test_angle_classifier():
+    def unit(deg):
+        a = np.radians(deg)
+        return [0, np.sin(a), np.cos(a)]
+
+    # (main, short 1, short 2) per row
+    rows = [
+        (unit(0), unit(0), unit(0)),      # side joint
+        (unit(4), unit(0), unit(180)),    # side joint, inside ANGLE_TOL
+        (unit(90), unit(0), unit(0)),     # T center, perpendicular main
+        (unit(8), unit(0), unit(4.5)),    # T center, main parallel to short 2
+        (unit(0), unit(0), unit(90)),     # short shells not parallel
+        (unit(45), unit(0), unit(0)),     # crossed
+        (unit(6), unit(0), unit(0)),      # crossed, just outside ANGLE_TOL
+    ]
+    normals = np.array(rows, dtype=np.float64)
+    side, center, not_parallel, crossed = script.classify_angle_triplets(
+        normals[:, 0], normals[:, 1], normals[:, 2]
+    )
+    assert side.tolist() == [0, 1]
+    assert center.tolist() == [2, 3]
+    assert not_parallel.tolist() == [4]
+    assert crossed.tolist() == [5, 6]
+
+
+def adjacency(n, links):
+    u = np.array([a for a, b in links] + [b for a, b in links], dtype=np.int64)
+    v = np.array([b for a, b in links] + [a for a, b in links], dtype=np.int64)
+    order = np.lexsort((v, u))
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(u, minlength=n), out=offsets[1:])
+    return offsets, v[order]
+
+
+def test_order_components():
+    # A chain listed out of order, a loop, and a tree: path 0-1-2-3-4 with
+    # the spur 2-5-6 (as long as the 0 arm).
+    chain = [(7, 9), (9, 8), (8, 10)]
+    loop = [(11, 12), (12, 13), (13, 11)]
+    tree = [(0, 1), (1, 2), (2, 3), (3, 4), (2, 5), (5, 6)]
+    adj_offsets, adj = adjacency(14, chain + loop + tree)
+    comp_order = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13])
+    comp_offsets = np.array([0, 7, 11, 14])
+
+    order, offsets = script.order_components(adj_offsets, adj, comp_order, comp_offsets)
+    groups = [order[offsets[c]:offsets[c + 1]].tolist() for c in range(3)]
+    # Tree: along the diameter 6-5-2-3-4, the 1-0 spur right after 2.
+    assert groups[0] == [6, 5, 2, 1, 0, 3, 4]
+    assert groups[1] == [7, 9, 8, 10]
+    assert groups[2] == [11, 12, 13]
+
+
+def test_group_connected_shells_order():
+    shells, grids = ladder(1, 6)
+    deck = install_backend(memory_deck(shells, grids))
+    elems = deck.CollectEntities(deck, None, "SHELL")
+    shuffled = [elems[i] for i in (3, 0, 5, 2, 4, 1)]
+
+    groups = script.group_connected_shells(deck, shuffled)
+    assert len(groups) == 1
+    ids = [e._id for e in groups[0]]
+    assert ids in ([1, 2, 3, 4, 5, 6], [6, 5, 4, 3, 2, 1])
+
+
+def small(*fields):
+    return "".join(f"{f!s:<8}" for f in fields)
+
+
+def large(*fields):
+    return f"{fields[0]!s:<8}" + "".join(f"{f!s:<16}" for f in fields[1:])
+
+
+BULK = "\n".join([
+    "SOL 101",
+    "CEND",
+    "SET 7 = 1 THRU 2",
+    "BEGIN BULK",
+    "$ANSA_NAME_COMMENT;7;SET;Lap_Joint_delt;",
+    small("GRID", 1, "", "0.", "0.", "0."),
+    large("GRID*", 2, "", "1.", "0."),
+    large("*", "0."),
+    "GRID,3,,1.,1.,1.5-3",
+    small("GRID", 4, "", "0.", "1.", "0."),
+    "INCLUDE 'more.bdf'",
+    small("CQUAD4", 1, 1, 1, 2, 3, 4),
+    small("SET1", 7, 2, "THRU", 3),
+    small("PSHELL", 1, 1),
+    small("MAT1", 1),
+    "ENDDATA",
+    "",
+])
+
+MORE = "\n".join([
+    small("GRID", 5, "", "2.", "0.", "0."),
+    small("GRID", 6, "", "2.", "1.", "0."),
+    small("CTRIA3", 2, 1, 2, 5, 6),
+    small("CQUAD4", 3, 1, 2, 5, 6, 3),
+    "",
+])
+
+
+def test_bulk_reader(tmp_path):
+    (tmp_path / "deck.bdf").write_text(BULK)
+    (tmp_path / "more.bdf").write_text(MORE)
+
+    reader = BulkReader()
+    reader.read(str(tmp_path / "deck.bdf"))
+    assert list(reader.grid_ids) == [1, 2, 3, 4, 5, 6]
+    assert reader.sets == {7: [2, 3]}
+    assert reader.case_sets == {7: [1, 2]}
+
+    read_nastran_bulk(str(tmp_path / "deck.bdf"), str(tmp_path / "snap"))
+    deck = open_deck_snapshot(str(tmp_path / "snap"))
+
+    assert deck.snap.elem_ids.tolist() == [1, 2, 3]
+    assert [deck.snap.node_ids(i) for i in range(3)] == [[1, 2, 3, 4], [2, 5, 6], [2, 5, 6, 3]]
+    assert np.allclose(deck.xyz[:4], [[0, 0, 0], [1, 0, 0], [1, 1, 1.5e-3], [0, 1, 0]])
+    assert set_ids(deck, "Lap_Joint_delt") == [2, 3]
+    assert set_ids(deck, "CASE_SET_7") == [1, 2]
+    assert [e._id for e in deck.CollectEntities(deck, None, "MATERIAL")] == [1]
+
+
+def test_free_field_short_lines():
+    # Fields left off a free-field line are blank; continuation fields
+    # always start at slot 8 (large-field: slot 4 per line).
+    f = card_fields([b"GRID,1,,1.,2."])
+    assert len(f) == 8 and f[2:5] == [b"1.", b"2.", b""]
+
+    f = card_fields([b"CQUAD8,10,1,1,2,3", b"+,7,8"])
+    assert f[:5] == [b"10", b"1", b"1", b"2", b"3"]
+    assert f[5:8] == [b"", b"", b""]
+    assert f[8:10] == [b"7", b"8"]
+
+    f = card_fields([b"GRID*,1,,1.", b"*,3."])
+    assert f[:4] == [b"1", b"", b"1.", b""] and f[4] == b"3."
+
+
+def test_free_field_short_cards(tmp_path):
+    (tmp_path / "deck.bdf").write_text("\n".join([
+        "BEGIN BULK",
+        "GRID,1,,0.,0.",
+        "GRID,2,,1.,0.,0.",
+        "GRID*,3,,1.,1.",
+        "*,2.",
+        "GRID,4,,0.,1.",
+        "CQUAD4,1,1,1,2",
+        "+,3,4",
+        "CQUAD4,2,1,1,2,3,4",
+        "ENDDATA",
+        "",
+    ]))
+    read_nastran_bulk(str(tmp_path / "deck.bdf"), str(tmp_path / "snap"))
+    deck = open_deck_snapshot(str(tmp_path / "snap"))
+
+    assert np.allclose(deck.xyz, [[0, 0, 0], [1, 0, 0], [1, 1, 2], [0, 1, 0]])
+    # The continuation of the short CQUAD4 1 is its second line (THETA, ...),
+    # not G3/G4.
+    assert [deck.snap.node_ids(i) for i in range(2)] == [[1, 2], [1, 2, 3, 4]]
@@ -0,0 +1,636 @@
+# Context: headless stand-in for ansa.base (no ANSA needed)
+# Purpose: Serve code.py from deck snapshot arrays for profiling and tests,
+#          and read NASTRAN bulk data straight into such a snapshot.
+#
+# Usage:   python weld_backend.py <deck.bdf> <snapshot_dir>
+
+import importlib.util
+import json
+import mmap
+import os
+import re
+import sys
+from array import array
+from types import SimpleNamespace
+
+import numpy as np
+
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code.py")
+
+
+def load_script(name="weld_script"):
+    # code.py shares its name with the standard library module, so it is
+    # loaded by path. It is registered in sys.modules so pool workers can
+    # unpickle its functions.
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+script = load_script()
+
+
+class SnapshotEntity:
+    __slots__ = ("ansa_type", "_id")
+
+    def __init__(self, ansa_type, eid):
+        self.ansa_type = ansa_type
+        self._id = eid
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, SnapshotEntity)
+            and self.ansa_type == other.ansa_type
+            and self._id == other._id
+        )
+
+    def __hash__(self):
+        return hash((self.ansa_type, self._id))
+
+    def __repr__(self):
+        return f"<{self.ansa_type} {self._id}>"
+
+
+class SnapshotEntities:
+    # Read-only list of entity handles over an ID array, made on access.
+
+    def __init__(self, ansa_type, ids):
+        self.ansa_type = ansa_type
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        return SnapshotEntity(self.ansa_type, int(self.ids[i]))
+
+    def __iter__(self):
+        return (SnapshotEntity(self.ansa_type, int(i)) for i in self.ids)
+
+
+class SnapshotChecks:
+    # base.Checks / base.Check stand-in. A triple bound is an edge shared by
+    # three or more visible shells; every such edge is one issue.
+    EXEC_ON_V15 = "visible"
+    EXEC_ON_VS = "visible"
+    REPORT_NONE = None
+
+    def __init__(self, deck):
+        self.deck = deck
+        self.mesh = SimpleNamespace(
+            TripleBounds=lambda: SimpleNamespace(execute=lambda **kwargs: [self.report()])
+        )
+
+    def GetViolations(self):
+        return SimpleNamespace(GetReport=lambda name: [self.report()])
+
+    def report(self):
+        deck = self.deck
+        vis = np.flatnonzero(deck.visible)
+        edges = script.EdgeIndex(deck.snap, vis)
+        issues = []
+        for k in edges.multi_edges(3).tolist():
+            ents = [deck.shells[i] for i in vis[edges.owners(k)].tolist()]
+            issues.append(SimpleNamespace(entities=ents, Entities=ents))
+        return SimpleNamespace(issues=issues, Issues=issues)
+
+
+class SnapshotDeck:
+    # The part of ansa.base code.py uses, served from snapshot arrays
+    # (memory-mapped from disk or built in memory). It stands in for the
+    # base module and is passed as the deck argument at the same time; see
+    # install_backend(). SET members are kept as sorted dense shell indices.
+
+    def __init__(self, arr, set_cards, mat_cards):
+        self.shells = SnapshotEntities("SHELL", arr["elem_ids"])
+        self.snap = script.ShellSnapshot(
+            arr["elem_ids"], arr["offsets"], arr["grid_ids"], arr["nodes"], self.shells
+        )
+        self.xyz = arr["xyz"]
+        self.visible = np.array(arr["visible"])
+        self.ring_index = None
+
+        self.set_cards = {}
+        self.set_members = {}
+        self.next_set = 0
+        for k, card in enumerate(set_cards):
+            ent = self._new_set(dict(card))
+            self.set_members[ent] = arr["set_members"][arr["set_offsets"][k]:arr["set_offsets"][k + 1]]
+
+        self.mat_cards = {}
+        self.mat_members = {}
+        for k, card in enumerate(mat_cards):
+            ent = SnapshotEntity("MATERIAL", card["MID"])
+            self.mat_cards[ent] = card
+            self.mat_members[ent] = arr["mat_members"][arr["mat_offsets"][k]:arr["mat_offsets"][k + 1]]
+
+        self.geometry = None
+        self.Checks = self.Check = SnapshotChecks(self)
+
+    def _new_set(self, card):
+        self.next_set += 1
+        ent = SnapshotEntity("SET", self.next_set)
+        self.set_cards[ent] = card
+        self.set_members[ent] = np.zeros(0, dtype=np.int64)
+        return ent
+
+    def _shell_index(self, ents):
+        ents = [e for e in ents if getattr(e, "ansa_type", None) == "SHELL"]
+        idx = self.snap.index(ents)
+        return idx[idx >= 0]
+
+    def _members(self, container):
+        if container is None:
+            return np.arange(len(self.snap))
+        if isinstance(container, (list, tuple, set)):
+            parts = [self._members(c) for c in container]
+            return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+        if container in self.set_members:
+            return self.set_members[container]
+        return self.mat_members.get(container, np.zeros(0, dtype=np.int64))
+
+    def CollectEntities(self, deck, containers, search_type, filter_visible=False, recursive=False):
+        if search_type == "SET":
+            return list(self.set_cards)
+        if search_type == "MATERIAL":
+            return list(self.mat_cards)
+        if search_type == "GRID" and containers is None:
+            return list(SnapshotEntities("GRID", self.snap.grid_ids))
+        if search_type not in ("SHELL", "__ALL_ENTITIES__"):
+            return []
+
+        idx = self._members(containers)
+        if filter_visible:
+            idx = idx[self.visible[idx]]
+        return [self.shells[i] for i in idx]
+
+    def GetEntityCardValues(self, deck, entity, fields):
+        if entity.ansa_type == "SHELL":
+            i = self.snap.index([entity])[0]
+            card = dict(zip(script.GRID_KEYS, self.snap.node_ids(i)))
+        elif entity.ansa_type == "GRID":
+            xyz = self.xyz[self.snap.grid_index([entity._id])[0]]
+            card = {} if np.isnan(xyz).any() else dict(zip(("X1", "X2", "X3"), xyz.tolist()))
+        elif entity.ansa_type == "SET":
+            card = self.set_cards[entity]
+        else:
+            card = self.mat_cards.get(entity, {})
+        return {k: card[k] for k in fields if card.get(k) is not None}
+
+    def GetEntity(self, deck, search_type, eid):
+        if search_type == "GRID" and self.snap.grid_index([eid])[0] >= 0:
+            return SnapshotEntity("GRID", eid)
+        if search_type == "SHELL" and self.snap.index_ids([eid])[0] >= 0:
+            return SnapshotEntity("SHELL", eid)
+        return None
+
+    def CreateEntity(self, deck, search_type, fields):
+        if search_type != "SET":
+            raise NotImplementedError(f"SnapshotDeck cannot create {search_type} entities.")
+        sid = fields.get("SID", fields.get("ID"))
+        if sid is None:
+            sid = max((c.get("SID") or 0 for c in self.set_cards.values()), default=0) + 1
+        return self._new_set({"Name": fields.get("Name"), "SID": sid})
+
+    def AddToSet(self, set_ent, entities):
+        self.set_members[set_ent] = np.union1d(
+            self.set_members[set_ent], self._shell_index(entities)
+        )
+
+    def RemoveFromSet(self, set_ent, entities):
+        self.set_members[set_ent] = np.setdiff1d(
+            self.set_members[set_ent], self._shell_index(entities)
+        )
+
+    def DeleteEntity(self, entities, force=False):
+        if isinstance(entities, SnapshotEntity):
+            entities = [entities]
+        for e in entities:
+            self.set_cards.pop(e, None)
+            self.set_members.pop(e, None)
+
+    def IsEntityVisible(self, entity):
+        if entity.ansa_type != "SHELL":
+            return True
+        i = self.snap.index([entity])[0]
+        return bool(i >= 0 and self.visible[i])
+
+    def Or(self, entities):
+        self.visible[:] = False
+        self.visible[self._shell_index(list(entities))] = True
+
+    def All(self):
+        self.visible[:] = True
+
+    def Neighb(self, steps):
+        if self.ring_index is None:
+            self.ring_index = script.NodeShellIndex(self.snap)
+        for _ in range(int(steps)):
+            self.visible[self.ring_index.ring(np.flatnonzero(self.visible))] = True
+
+    def GetNormalVectorOfShell(self, shell):
+        if self.geometry is None:
+            self.geometry = script.ShellGeometry(
+                self.snap, script.GridCoordinates(self, self.snap.grid_ids, self.xyz)
+            )
+        i = self.snap.index([shell])[0]
+        n = self.geometry.normals([i])[0]
+        return None if i < 0 or np.isnan(n).any() else n.tolist()
+
+    def Highlight(self, *args, **kwargs):
+        pass
+
+
+def load_deck_snapshot(path):
+    # Maps the snapshot arrays read-only, nothing is copied.
+    with open(os.path.join(path, "manifest.json")) as fh:
+        manifest = json.load(fh)
+    if manifest.get("format") != script.SNAPSHOT_FORMAT:
+        raise ValueError(f"'{path}' is not a deck snapshot.")
+    if manifest.get("version") != script.SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported deck snapshot version {manifest.get('version')}.")
+
+    arr = {
+        name: np.load(os.path.join(path, spec["file"]), mmap_mode="r")
+        for name, spec in manifest["arrays"].items()
+    }
+    return SnapshotDeck(arr, manifest["sets"], manifest["materials"])
+
+
+def rows_deck(eids, counts, flat, gids, xyz, sets=None, materials=None, hidden=()):
+    # In-memory deck from flat arrays: shell i is eids[i] with counts[i]
+    # GRIDs in flat, GRID gids[k] sits at xyz[k]. sets / materials map a
+    # name to element IDs (SIDs/MIDs follow the order given); hidden
+    # elements start out not visible.
+    snap = script.snapshot_from_rows(eids, counts, flat)
+    xyz = script.coords_for(snap.grid_ids, gids, xyz)
+
+    def members(ids):
+        idx = snap.index_ids(np.asarray(ids, dtype=np.int64))
+        return np.unique(idx[idx >= 0])
+
+    visible = np.ones(len(snap), dtype=bool)
+    visible[members(list(hidden))] = False
+
+    set_list = [
+        ({"Name": name, "SID": sid}, members(ids))
+        for sid, (name, ids) in enumerate((sets or {}).items(), start=1)
+    ]
+    mat_list = [
+        ({"Name": name, "MID": mid}, members(ids))
+        for mid, (name, ids) in enumerate((materials or {}).items(), start=1)
+    ]
+
+    arrays = script.snapshot_arrays(snap, xyz, visible, set_list, mat_list)
+    return SnapshotDeck(arrays, [c for c, _ in set_list], [c for c, _ in mat_list])
+
+
+def memory_deck(shells, grids, sets=None, materials=None, hidden=()):
+    # rows_deck from dicts: shells {EID: [G1, G2, ...]}, grids
+    # {GID: (x, y, z)}, sets and materials {name: [EID, ...]}.
+    eids = list(shells)
+    return rows_deck(
+        np.array(eids, dtype=np.int64),
+        np.array([len(shells[e]) for e in eids], dtype=np.int64),
+        np.array([g for e in eids for g in shells[e]], dtype=np.int64),
+        np.array(list(grids), dtype=np.int64),
+        np.array(list(grids.values()), dtype=np.float64).reshape(-1, 3),
+        {name: list(ids) for name, ids in (sets or {}).items()},
+        {name: list(ids) for name, ids in (materials or {}).items()},
+        hidden
+    )
+
+
+def install_backend(deck):
+    # Makes a SnapshotDeck the base (and constants.NASTRAN) code.py talks
+    # to, with its arrays seeded into the run cache. An ApiRecorder already
+    # in place keeps recording against the new deck.
+    if isinstance(script.base, script.ApiRecorder):
+        script.base._target = deck
+    else:
+        script.base = deck
+    script.constants = SimpleNamespace(NASTRAN=deck)
+
+    script.reset_run_cache()
+    script.run_cache(("snapshot", deck), lambda: deck.snap)
+    script.run_cache(
+        ("coords", deck),
+        lambda: script.GridCoordinates(deck, deck.snap.grid_ids, deck.xyz)
+    )
+    return deck
+
+
+def open_deck_snapshot(path):
+    return install_backend(load_deck_snapshot(path))
+
+
+# NASTRAN bulk data reader: streams a .bdf/.nas file through a memory map
+# and writes the same snapshot export_deck_snapshot() does. Only the cards
+# the weld logic needs are decoded; everything else is skipped unparsed.
+
+BULK_SHELLS = {
+    b"CQUAD4": 4,
+    b"CTRIA3": 3,
+    b"CQUAD8": 8,
+    b"CTRIA6": 6,
+}
+BULK_CARDS = set(BULK_SHELLS) | {b"GRID", b"PSHELL", b"MAT1", b"SET1"}
+
+BEGIN_BULK = re.compile(rb"^[ \t]*BEGIN[ \t]+(BULK|SUPER)", re.IGNORECASE | re.MULTILINE)
+CASE_SET = re.compile(rb"^\s*SET\s+(\d+)\s*=(.*)$", re.IGNORECASE | re.DOTALL)
+INCLUDE = re.compile(rb"^INCLUDE\s*'([^']*)'?", re.IGNORECASE)
+
+
+def nastran_int(text):
+    text = text.strip()
+    return int(text) if text else 0
+
+
+def nastran_float(text):
+    text = text.strip().upper().replace(b"D", b"E")
+    if not text:
+        return 0.0
+    try:
+        return float(text)
+    except ValueError:
+        # Implied exponent: 1.5-3, -.25+2
+        k = max(text.rfind(b"+"), text.rfind(b"-"))
+        return float(text[:k] + b"E" + text[k:])
+
+
+def card_name(line):
+    head = line.split(b",", 1)[0] if b"," in line[:10] else line[:8]
+    return head.strip().upper()
+
+
+def is_continuation(line):
+    return line[:1] in (b"+", b"*", b",") or not line[:8].strip()
+
+
+def card_fields(lines):
+    # Data fields (name and continuation markers dropped) of one card given
+    # as its raw lines, each in small-field, large-field or free-field form.
+    fields = []
+    for k, line in enumerate(lines):
+        if b"," in line:
+            # Fields left off the end of a free-field line are blank, so
+            # every line still fills its 8 (large-field 4) slots.
+            parts = line.split(b",")
+            width = 4 if parts[0].strip().endswith(b"*") else 8
+            data = parts[1:1 + width]
+            fields.extend(data + [b""] * (width - len(data)))
+            continue
+
+        if k == 0:
+            wide = line[:8].strip().endswith(b"*")
+        else:
+            wide = line[:1] == b"*"
+        width = 16 if wide else 8
+        fields.extend(line[8 + i * width:8 + (i + 1) * width] for i in range(64 // width))
+    return fields
+
+
+def id_list(tokens):
+    # Integers with "a THRU b" ranges and "EXCEPT" exclusions.
+    ids = []
+    tokens = [t.strip().upper() for t in tokens if t.strip()]
+    i = 0
+    except_ids = set()
+    excepting = False
+    while i < len(tokens):
+        t = tokens[i]
+        if t == b"EXCEPT":
+            excepting = True
+        elif t == b"THRU" and ids and i + 1 < len(tokens):
+            first = ids[-1] + 1
+            last = int(tokens[i + 1])
+            ids.extend(range(first, last + 1))
+            i += 1
+        elif t.lstrip(b"-").isdigit():
+            if excepting:
+                except_ids.add(int(t))
+            else:
+                ids.append(int(t))
+        else:
+            excepting = False
+        i += 1
+    return [n for n in ids if n not in except_ids]
+
+
+class BulkReader:
+    # Accumulates the decoded cards in flat typed arrays. Case control SETs
+    # are their own ID space and are kept apart from the bulk SET1 cards.
+
+    def __init__(self):
+        self.grid_ids = array("q")
+        self.grid_xyz = array("d")
+        self.elem_ids = array("q")
+        self.elem_pids = array("q")
+        self.counts = array("q")
+        self.flat = array("q")
+        self.pshell_mid = {}
+        self.mat_ids = []
+        self.sets = {}
+        self.case_sets = {}
+        self.names = {}
+
+    def comment(self, line):
+        # $ANSA_NAME_COMMENT;<id>;<keyword>;<name>;... as ANSA writes it.
+        if line.startswith(b"$ANSA_NAME_COMMENT;"):
+            parts = line.rstrip().split(b";")
+            if len(parts) > 3 and parts[1].strip().isdigit():
+                key = (parts[2].strip().upper().decode(), int(parts[1]))
+                self.names[key] = parts[3].decode(errors="replace").strip()
+
+    def card(self, name, lines):
+        f = card_fields(lines)
+        if name == b"GRID":
+            self.grid_ids.append(nastran_int(f[0]))
+            self.grid_xyz.extend(nastran_float(x) for x in f[2:5])
+        elif name in BULK_SHELLS:
+            grids = [g for g in (nastran_int(x) for x in f[2:2 + BULK_SHELLS[name]]) if g]
+            self.elem_ids.append(nastran_int(f[0]))
+            self.elem_pids.append(nastran_int(f[1]))
+            self.counts.append(len(grids))
+            self.flat.extend(grids)
+        elif name == b"PSHELL":
+            self.pshell_mid[nastran_int(f[0])] = nastran_int(f[1])
+        elif name == b"MAT1":
+            self.mat_ids.append(nastran_int(f[0]))
+        elif name == b"SET1":
+            tokens = [x for x in f[1:] if x.strip().upper() != b"SKIN"]
+            self.sets.setdefault(nastran_int(f[0]), []).extend(id_list(tokens))
+
+    def case_set(self, sid, text):
+        tokens = re.split(rb"[,\s]+", text)
+        if not any(t.strip().upper() == b"ALL" for t in tokens):
+            self.case_sets.setdefault(sid, []).extend(id_list(tokens))
+
+    def include(self, path, line, in_bulk):
+        # INCLUDE 'file' on one line, relative to the including file.
+        m = INCLUDE.match(line.strip())
+        name = m.group(1).decode(errors="replace").strip() if m else ""
+        target = os.path.join(os.path.dirname(path), name)
+        if not name or not os.path.isfile(target):
+            print(f"Warning: cannot follow {line.strip().decode(errors='replace')} in '{path}'")
+            return
+        self.read(target, in_bulk)
+
+    def read(self, path, in_bulk=None):
+        # in_bulk is given for included files: they continue the section of
+        # the line that includes them.
+        if os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if in_bulk is None:
+                in_bulk = BEGIN_BULK.search(mm) is None
+
+            pending = None
+            lines = []
+            case_set = None
+
+            for raw in iter(mm.readline, b""):
+                line = raw.rstrip(b"\r\n").expandtabs(8)
+
+                if line[:1] == b"$":
+                    self.comment(line)
+                    continue
+
+                if line[:7].upper() == b"INCLUDE":
+                    if pending is not None:
+                        self.card(pending, lines)
+                        pending = None
+                    self.include(path, line, in_bulk)
+                    continue
+
+                if not in_bulk:
+                    if case_set is not None:
+                        case_set[1] += b" " + line
+                        if not line.rstrip().endswith(b","):
+                            self.case_set(*case_set)
+                            case_set = None
+                    elif BEGIN_BULK.match(line):
+                        in_bulk = True
+                    else:
+                        m = CASE_SET.match(line)
+                        if m:
+                            case_set = [int(m.group(1)), m.group(2)]
+                            if not line.rstrip().endswith(b","):
+                                self.case_set(*case_set)
+                                case_set = None
+                    continue
+
+                if not line.strip():
+                    continue
+
+                if is_continuation(line):
+                    if pending is not None:
+                        lines.append(line)
+                    continue
+
+                if pending is not None:
+                    self.card(pending, lines)
+                    pending = None
+
+                name = card_name(line).rstrip(b"*")
+                if name == b"ENDDATA":
+                    break
+                if name in BULK_CARDS:
+                    pending = name
+                    lines = [line]
+
+            if pending is not None:
+                self.card(pending, lines)
+
+    def snapshot(self):
+        ids = np.frombuffer(self.elem_ids, dtype=np.int64)
+        snap = script.snapshot_from_rows(
+            ids,
+            np.frombuffer(self.counts, dtype=np.int64),
+            np.frombuffer(self.flat, dtype=np.int64)
+        )
+
+        xyz = script.coords_for(
+            snap.grid_ids,
+            np.frombuffer(self.grid_ids, dtype=np.int64),
+            np.frombuffer(self.grid_xyz, dtype=np.float64).reshape(-1, 3)
+        )
+
+        elem_pids = np.frombuffer(self.elem_pids, dtype=np.int64)[np.argsort(ids, kind="stable")]
+        elem_mids = np.array([self.pshell_mid.get(p, 0) for p in elem_pids.tolist()], dtype=np.int64)
+
+        materials = [
+            (
+                {"Name": self.names.get(("MAT1", mid), f"MAT1_{mid}"), "MID": mid},
+                np.flatnonzero(elem_mids == mid)
+            )
+            for mid in self.mat_ids
+        ]
+
+        sets = []
+        for sid, members in self.sets.items():
+            idx = snap.index_ids(np.array(members, dtype=np.int64))
+            name = self.names.get(("SET1", sid)) or self.names.get(("SET", sid)) or f"SET_{sid}"
+            sets.append(({"Name": name, "SID": sid}, np.unique(idx[idx >= 0])))
+        for sid, members in self.case_sets.items():
+            idx = snap.index_ids(np.array(members, dtype=np.int64))
+            sets.append(({"Name": f"CASE_SET_{sid}", "SID": sid}, np.unique(idx[idx >= 0])))
+
+        return snap, xyz, sets, materials
+
+
+def read_nastran_bulk(bulk_path, snapshot_dir):
+    reader = BulkReader()
+    reader.read(bulk_path)
+    snap, xyz, sets, materials = reader.snapshot()
+    visible = np.ones(len(snap), dtype=bool)
+    return script.write_deck_snapshot(snapshot_dir, snap, xyz, visible, sets, materials)
+
+
+def run_offline(bulk_path, snapshot_dir):
+    # Batch run of the lap/T assignment on a NASTRAN deck. The snapshot is
+    # reused when it already exists; results go to snapshot_dir/result.
+    report = script.start_run_report()
+
+    try:
+        with script.run_stage("read_nastran_bulk") as span:
+            if not os.path.exists(os.path.join(snapshot_dir, "manifest.json")):
+                read_nastran_bulk(bulk_path, snapshot_dir)
+            deck = open_deck_snapshot(snapshot_dir)
+            span["elements"] = len(deck.snap)
+
+        # The assignment needs all four lap label sets, as main() needs the
+        # joint deck sets.
+        registry = script.set_registry(deck)
+        labels = (script.SET_A, script.SET_B, script.SET_C, script.SET_T)
+        missing = [name for name in labels if not registry.get(name)]
+        for name in missing:
+            print(f"SET '{name}' not found.")
+
+        with script.run_stage("run_assignment"):
+            script.base.All()
+            if not missing:
+                script.run_assignment(deck)
+
+        with script.run_stage("run_lap_assignment"):
+            script.base.All()
+            if not missing:
+                state_path = None
+                if script.INCREMENTAL:
+                    state_path = os.path.join(snapshot_dir, script.CLASSIFICATION_STATE)
+                script.run_lap_assignment(deck, state_path=state_path)
+
+        with script.run_stage("export_result"):
+            script.export_deck_snapshot(deck, os.path.join(snapshot_dir, "result"))
+    finally:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        report.write(os.path.join(snapshot_dir, script.RUN_REPORT_PATH))
+
+
+if __name__ == "__main__":
+    run_offline(sys.argv[1], sys.argv[2])
@@ -0,0 +1,275 @@
+# Context: headless development tooling for code.py (no ANSA needed)
+# Purpose: Generate synthetic weld meshes and time every weld stage on them
+#          at growing scales.
+#
+# Usage:   python weld_bench.py [n_shells ...]
+
+import contextlib
+import math
+import os
+import sys
+import time
+import tracemalloc
+from array import array
+from collections import defaultdict
+
+import numpy as np
+
+from weld_backend import install_backend, rows_deck, script
+
+
+# Synthetic weld meshes and the scaling benchmark. Every generated unit
+# sits on its own lattice spot, 30 length units apart, so units never touch.
+
+class WeldMeshBuilder:
+    KINDS = {
+        "lap": 3,
+        "tjoint": 2,
+        "chain": 1,
+        "loop": 1,
+        "branch": 1,
+        "double": 1,
+        "degenerate": 1,
+    }
+
+    def __init__(self, seed=0, noise=0.0):
+        self.rng = np.random.default_rng(seed)
+        self.noise = noise
+        self.xyz = array("d")
+        self.counts = array("q")
+        self.flat = array("q")
+        self.sets = defaultdict(lambda: array("q"))
+        self.units = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def origin(self):
+        u = self.units
+        self.units += 1
+        return 30.0 * (u % 1024), 30.0 * (u // 1024)
+
+    def grid(self, x, y, z):
+        self.xyz.extend((x, y, z))
+        return len(self.xyz) // 3
+
+    def line(self, ox, y, z, n):
+        return [self.grid(ox + i, y, z) for i in range(n + 1)]
+
+    def shell(self, grids, *labels):
+        self.counts.append(len(grids))
+        self.flat.extend(grids)
+        eid = len(self.counts)
+        for lbl in labels:
+            self.sets[lbl].append(eid)
+        return eid
+
+    def quads(self, l1, l2, labels=(), start=0, stop=None):
+        for i in range(start, len(l1) - 1 if stop is None else stop):
+            self.shell((l1[i], l1[i + 1], l2[i + 1], l2[i]), *labels)
+
+    def lap(self):
+        # T, C, A, B around one center node plus a second A shell, the
+        # layout run_lap_assignment resolves.
+        ox, oy = self.origin()
+        s = self.rng.choice((-1.0, 1.0))
+        g = self.grid
+        c = g(ox, oy, 0)
+        t1 = g(ox + 1, oy, 0)
+        t2 = g(ox + 1, oy + 1, 0)
+        t3 = g(ox, oy + 1, 0)
+        self.shell((c, t1, t2, t3), script.SET_T)
+        c1 = g(ox + 2, oy, 0)
+        c2 = g(ox + 2, oy - 1, 0.5 * s)
+        c3 = g(ox + 1, oy - 1, 0)
+        self.shell((t1, c1, c2, c3), script.SET_C)
+        a1 = g(ox - 1, oy, 0)
+        a2 = g(ox - 1, oy + 1, s)
+        a3 = g(ox, oy + 1, s)
+        if self.rng.random() < 1 / 3:
+            self.shell((c, a1, a2, a3), script.SET_A)
+        else:
+            self.shell((c, a3, a2, a1), script.SET_A)
+        b1 = g(ox, oy - 1, 0)
+        b2 = g(ox - 1, oy - 1, 0)
+        b3 = g(ox - 1, oy - 0.5, -s)
+        self.shell((c, b1, b2, b3), script.SET_B)
+        a4 = g(ox - 2, oy, 0)
+        a5 = g(ox - 2, oy + 1, s)
+        self.shell((a1, a4, a5, a2), script.SET_A)
+
+    def tjoint(self, n=8):
+        # T row between an A row and a half B row; the other half of the B
+        # row is unlabelled and carries a web, which is side C.
+        ox, oy = self.origin()
+        ya = self.line(ox, oy - 1, 0, n)
+        y0 = self.line(ox, oy, 0, n)
+        y1 = self.line(ox, oy + 1, 0, n)
+        y2 = self.line(ox, oy + 2, 0, n)
+        web = self.line(ox, oy + 1, 1.0, n)
+        self.quads(ya, y0, ("T_Joint_delt_Side_A",))
+        self.quads(y0, y1, ("T_Joint_delt",))
+        self.quads(y1, y2, ("T_Joint_delt_Side_B",), 0, n // 2)
+        self.quads(y1, y2, (), n // 2, n)
+        self.quads(y1, web, (), n // 2, n)
+
+    def chain(self, n=8):
+        ox, oy = self.origin()
+        self.quads(self.line(ox, oy, 0, n), self.line(ox, oy + 1, 0, n), ("weld_elements",))
+
+    def double(self, n=8):
+        ox, oy = self.origin()
+        lines = [self.line(ox, oy + k, 0, n) for k in range(3)]
+        self.quads(lines[0], lines[1], ("weld_elements",))
+        self.quads(lines[1], lines[2], ("weld_elements",))
+
+    def loop(self, n=12):
+        ox, oy = self.origin()
+        ang = 2 * math.pi * np.arange(n) / n
+        inner = [self.grid(ox + 2 * math.cos(a), oy + 2 * math.sin(a), 0) for a in ang]
+        outer = [self.grid(ox + 3 * math.cos(a), oy + 3 * math.sin(a), 0) for a in ang]
+        for i in range(n):
+            j = (i + 1) % n
+            self.shell((inner[i], inner[j], outer[j], outer[i]), "weld_elements")
+
+    def branch(self, arm=4):
+        # A straight chain with a third arm leaving its middle shell.
+        ox, oy = self.origin()
+        n = 2 * arm + 1
+        l0 = self.line(ox, oy, 0, n)
+        l1 = self.line(ox, oy + 1, 0, n)
+        self.quads(l0, l1, ("weld_elements",))
+        left = [l1[arm]] + [self.grid(ox + arm, oy + 1 + k, 0) for k in range(1, arm + 1)]
+        right = [l1[arm + 1]] + [self.grid(ox + arm + 1, oy + 1 + k, 0) for k in range(1, arm + 1)]
+        for k in range(arm):
+            self.shell((left[k], right[k], right[k + 1], left[k + 1]), "weld_elements")
+
+    def degenerate(self):
+        # Collapsed quad, a triangle and partial lap labels: a group the
+        # classifiers must skip.
+        ox, oy = self.origin()
+        l0 = self.line(ox, oy, 0, 2)
+        l1 = self.line(ox, oy + 1, 0, 2)
+        self.shell((l0[0], l0[1], l1[1], l1[0]), script.SET_T, "weld_elements")
+        self.shell((l0[1], l0[2], l1[2], l1[2]), script.SET_A, "weld_elements")
+        self.shell((l0[2], self.grid(ox + 3, oy, 0), l1[2]), "weld_elements")
+
+    def deck(self):
+        xyz = np.frombuffer(self.xyz, dtype=np.float64).reshape(-1, 3).copy()
+        if self.noise:
+            xyz += self.rng.normal(scale=self.noise, size=xyz.shape)
+        eids = np.arange(1, len(self) + 1, dtype=np.int64)
+        return rows_deck(
+            eids,
+            np.frombuffer(self.counts, dtype=np.int64),
+            np.frombuffer(self.flat, dtype=np.int64),
+            np.arange(1, len(xyz) + 1, dtype=np.int64),
+            xyz,
+            {name: np.frombuffer(ids, dtype=np.int64) for name, ids in self.sets.items()},
+            {"SHELL_MAT": eids}
+        )
+
+
+def weld_mesh(n_shells, seed=0, noise=0.0, kinds=None):
+    # Random mix of units (weights per kind) until n_shells is reached.
+    builder = WeldMeshBuilder(seed, noise)
+    kinds = kinds or WeldMeshBuilder.KINDS
+    names = list(kinds)
+    p = np.array([kinds[k] for k in names], dtype=np.float64)
+    p /= p.sum()
+
+    while len(builder) < n_shells:
+        for k in builder.rng.choice(len(names), size=256, p=p).tolist():
+            getattr(builder, names[k])()
+            if len(builder) >= n_shells:
+                break
+    return builder
+
+
+BENCH_SCALES = (1_000, 10_000, 100_000, 1_000_000, 2_000_000)
+
+BENCH_STAGES = (
+    ("group_connected_shells", lambda deck, weld: script.group_connected_shells(deck, weld)),
+    ("run_lap_assignment", lambda deck, weld: script.run_lap_assignment(deck)),
+    ("run_assignment", lambda deck, weld: script.run_assignment(deck)),
+    ("create_global_sets_for_double_chains",
+     lambda deck, weld: script.create_global_sets_for_double_chains(deck, "weld_elements")),
+    ("build_T_joint_side_C", lambda deck, weld: script.build_T_joint_side_C(deck)),
+)
+
+
+def run_benchmark(scales=BENCH_SCALES, seed=0, noise=0.0, memory=True):
+    # Times every stage on a fresh in-memory deck per scale and stage, with
+    # the stage output suppressed. Peak memory is what tracemalloc sees
+    # above the level at stage start (NumPy buffers included).
+    results = {name: [] for name, _ in BENCH_STAGES}
+    if memory:
+        tracemalloc.start()
+
+    try:
+        for n in scales:
+            builder = weld_mesh(n, seed, noise)
+            for name, stage in BENCH_STAGES:
+                deck = install_backend(builder.deck())
+                weld_set = script.set_registry(deck).get("weld_elements")
+                weld = script.base.CollectEntities(deck, weld_set, "SHELL")
+
+                if memory:
+                    tracemalloc.reset_peak()
+                    start_mem = tracemalloc.get_traced_memory()[0]
+
+                error = None
+                t0 = time.perf_counter()
+                with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+                    try:
+                        stage(deck, weld)
+                    except Exception as exc:
+                        error = f"{type(exc).__name__}: {exc}"
+                seconds = time.perf_counter() - t0
+
+                peak = tracemalloc.get_traced_memory()[1] - start_mem if memory else None
+                results[name].append({
+                    "shells": len(builder),
+                    "seconds": seconds,
+                    "shells_per_s": len(builder) / seconds if seconds > 0 else None,
+                    "peak_bytes": peak,
+                    "error": error,
+                })
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+    report = {}
+    for name, rows in results.items():
+        ok = [r for r in rows if r["error"] is None and r["seconds"] > 0]
+        exponent = None
+        if len(ok) >= 2:
+            exponent = float(np.polyfit(
+                np.log([r["shells"] for r in ok]),
+                np.log([r["seconds"] for r in ok]),
+                1
+            )[0])
+        report[name] = {"runs": rows, "exponent": exponent}
+
+    print_benchmark(report)
+    return report
+
+
+def print_benchmark(report):
+    print(f"{'stage':<40}{'shells':>10}{'seconds':>10}{'shells/s':>12}{'peak MB':>10}")
+    for name, entry in report.items():
+        for r in entry["runs"]:
+            if r["error"]:
+                print(f"{name:<40}{r['shells']:>10}  {r['error']}")
+                continue
+            peak = "" if r["peak_bytes"] is None else f"{r['peak_bytes'] / 2**20:.1f}"
+            print(
+                f"{name:<40}{r['shells']:>10}{r['seconds']:>10.3f}"
+                f"{r['shells_per_s'] or 0:>12.0f}{peak:>10}"
+            )
+        if entry["exponent"] is not None:
+            print(f"{name:<40}{'fitted exponent':>32}{entry['exponent']:>10.2f}")
+
+
+if __name__ == "__main__":
+    run_benchmark([int(n) for n in sys.argv[1:]] or BENCH_SCALES)